@@ -0,0 +1,92 @@
+import socket
+
+# Talks to the adb server directly over its local socket (the same thing the adb binary does) so we
+# don't have to spawn an `adb` process for every little query.
+#
+# Wire format: every request is a 4 digit hex length followed by the service name, e.g.
+# "000chost:version". The server answers "OKAY" or "FAIL" + hex length + error message. Some
+# services (host:devices, host:track-devices) then send hex-length-prefixed blocks of text.
+
+ADB_HOST = "127.0.0.1"
+ADB_PORT = 5037
+
+
+class AdbError(Exception):
+    pass
+
+
+class AdbClient:
+    def __init__(self, host=ADB_HOST, port=ADB_PORT, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def connect(self, timeout=None):
+        sock = socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+        return sock
+
+    def request(self, sock, service):
+        # sends one service request and raises AdbError if the server says FAIL
+        data = service.encode()
+        sock.sendall(b"%04x" % len(data) + data)
+        status = read_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(read_block(sock).decode(errors="replace"))
+        raise AdbError(f"unexpected reply from adb server: {status!r}")
+
+    def query(self, service):
+        # one-shot host service that answers with a single block, e.g. host:devices, host:version
+        with self.connect() as sock:
+            self.request(sock, service)
+            return read_block(sock).decode(errors="replace")
+
+    def devices(self):
+        return parse_devices(self.query("host:devices"))
+
+    def device_service(self, serial, service, timeout=None):
+        # runs a service on the device (shell:..., tcpip:...) and returns everything it printed,
+        # these just write until they're done and close the connection
+        with self.connect(timeout) as sock:
+            self.request(sock, f"host:transport:{serial}")
+            self.request(sock, service)
+            return read_all(sock).decode(errors="replace")
+
+    def shell(self, serial, command, timeout=None):
+        return self.device_service(serial, f"shell:{command}", timeout)
+
+
+def read_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("adb server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def read_block(sock):
+    size = int(read_exact(sock, 4), 16)
+    return read_exact(sock, size) if size else b""
+
+
+def parse_devices(text):
+    # "serial\tstate\n..." -> {serial: state}
+    devices = {}
+    for line in text.splitlines():
+        parts = line.split("\t")
+        if len(parts) >= 2 and parts[0]:
+            devices[parts[0]] = parts[1].strip()
+    return devices
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+# Inference backends for the detector. They all do the same thing: take a square BGR image that's
+# already letterboxed (see detector.letterbox) and return the best box as (x1, y1, x2, y2) in that
+# image's coordinates, or None. Exported models only take the `imgsz` they were built for and say so
+# with fixed_size = True; ultralytics runs at whatever size the image is.
+#
+#   ultralytics  plain YOLO("model.pt"), PyTorch eager. works everywhere, slowest on CPU
+#   onnx         ONNX Runtime on an exported .onnx, optionally INT8 (dynamic quantization)
+#   openvino     OpenVINO on an exported IR, fastest on Intel CPUs
+#
+# Exported models are cached in .model_cache/ next to the .pt, named after the weights' hash, the
+# input size and the options, so the export only happens the first time.
+
+CONF_THRESHOLD = 0.25
+
+
+class UltralyticsBackend:
+    def __init__(self, model_path, imgsz=320, threads=None):
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(model_path) # initialize model. u should understand this i believe so
+        self.imgsz = imgsz
+
+    def detect(self, image):
+        # imgsz=0 means full frames at the model's default size, otherwise run at the letterboxed image's size
+        kwargs = {"imgsz": max(image.shape[:2])} if self.imgsz else {}
+        results = self.model(image, verbose=False, **kwargs) # Returns Results objects in a list. The different elements of this results list point to different detected objects
+        if len(results[0].boxes) == 0: # results[n].boxes is a boxes object. Contains methods like xyxy, xywh, etc.
+            return None
+        # xyxy would return xy coordinates of both left upper corner and right lower corner gives a tensor [x1, y1, x2, y2] (i dont know what tensors are so dont ask me) 1 is the upper left one, 2 is the bottom right one
+        box = results[0].boxes[0].xyxy[0].cpu().numpy() # our model processing happening in GPU by default but numpy operates in CPU. so .cpu() will move it to cpu memory and .numpy() will convert it to numpy array
+        return tuple(float(v) for v in box)
+
+
+class OnnxBackend:
+    fixed_size = True
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def detect(self, image):
+        output = self.session.run(None, {self.input_name: to_blob(image)})[0]
+        return best_box(output)
+
+
+class OpenVinoBackend:
+    fixed_size = True
+
+    def __init__(self, path, threads=None):
+        import openvino as ov
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        self.model = ov.Core().compile_model(path, "CPU", config)
+
+    def detect(self, image):
+        output = self.model(to_blob(image))[0]
+        return best_box(output)
+
+
+def to_blob(image):
+    # BGR uint8 HWC -> RGB float32 NCHW in 0..1, what the exported YOLO graph wants
+    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, swapRB=True)
+    return np.ascontiguousarray(blob, dtype=np.float32)
+
+
+def best_box(output):
+    # raw YOLOv8 head: (1, 4 + classes, anchors), rows are cx, cy, w, h, then one score per class.
+    # We only ever use the single most confident box, so there's no need for NMS.
+    predictions = output[0]
+    scores = predictions[4:].max(axis=0)
+    best = int(scores.argmax())
+    if scores[best] < CONF_THRESHOLD:
+        return None
+    cx, cy, w, h = predictions[:4, best]
+    return (float(cx - w / 2), float(cy - h / 2), float(cx + w / 2), float(cy + h / 2))
+
+
+def model_hash(model_path):
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def cached_export(model_path, kind, imgsz, int8=False):
+    # returns the path of the exported model for `kind`, exporting it the first time
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(model_path)), ".model_cache")
+    name = f"{model_hash(model_path)}_{imgsz}{'_int8' if int8 else ''}"
+    if kind == "onnx":
+        target = os.path.join(cache_dir, name + ".onnx")
+    else:
+        target = os.path.join(cache_dir, name + "_openvino", "model.xml")
+    if os.path.exists(target):
+        return target
+
+    from ultralytics import YOLO
+    os.makedirs(cache_dir, exist_ok=True)
+    if kind == "onnx":
+        exported = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True)
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+        else:
+            shutil.move(exported, target)
+    else:
+        # ultralytics does the INT8 calibration for OpenVINO itself (needs its calibration data)
+        exported = YOLO(model_path).export(format="openvino", imgsz=imgsz, int8=int8)
+        xml = next(f for f in os.listdir(exported) if f.endswith(".xml"))
+        os.rename(os.path.join(exported, xml), os.path.join(exported, "model.xml"))
+        os.rename(os.path.join(exported, xml[:-4] + ".bin"), os.path.join(exported, "model.bin"))
+        shutil.move(exported, os.path.dirname(target))
+    return target
+
+
+def create_backend(kind, model_path, imgsz=320, int8=False, threads=None):
+    # kind is "ultralytics", "onnx", "openvino" or "auto" (onnx if onnxruntime is installed, else ultralytics)
+    if kind == "auto":
+        try:
+            import onnxruntime # noqa: F401
+            kind = "onnx"
+        except ImportError:
+            kind = "ultralytics"
+
+    if kind == "ultralytics":
+        return UltralyticsBackend(model_path, imgsz, threads)
+    if not imgsz:
+        raise ValueError(f"the {kind} backend needs a fixed inference size")
+    path = cached_export(model_path, kind, imgsz, int8)
+    if kind == "onnx":
+        return OnnxBackend(path, threads)
+    if kind == "openvino":
+        return OpenVinoBackend(path, threads)
+    raise ValueError(f"unknown inference backend: {kind}")
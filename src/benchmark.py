@@ -0,0 +1,304 @@
+# Headless benchmark for the Cammy frame path. No camera, GPU, display or v4l2loopback needed.
+# Drives the same FramePipeline/FrameProcessor TabCammy uses from a synthetic (or recorded) source
+# into a null (or file) sink, over a matrix of resolutions, detection intervals, aspect ratios and
+# mirror settings. Every case runs in a fresh process so peak RSS is per case.
+#
+#   python src/benchmark.py
+#   python src/benchmark.py --resolutions 480p,1080p,4k --ratios Auto,16:9,1:1 --mirror none,y,xy --json bench.json
+#   python src/benchmark.py --source clip.mp4 --backend onnx --model src/model.pt --duration 20
+#   python src/benchmark.py --source phone.h264   (raw scrcpy-style stream, decoded like ScrcpySource does)
+#   python src/benchmark.py --bus-readers 2 --bus-reader-ms 50   (also publish on the frame bus, reader 0 keeps up, reader 1 is slow and skips)
+#   python src/benchmark.py --record /tmp/rec_{segment}.mp4 --record-segment 2   (background recording next to the null sink)
+#   python src/benchmark.py --source mjpeg --resolutions 1080p,4k --unpaced   (parallel MJPEG decode, or a .mjpeg file)
+#   python src/benchmark.py --compare-backends ultralytics,onnx,openvino --model src/model.pt
+
+import argparse
+import itertools
+import json
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from backends import create_backend
+from detector import letterbox
+from frame_bus import FrameBusReader
+from frame_processor import FrameProcessor
+from pipeline import FramePipeline
+from sinks import FileSink, FrameBusSink, NullSink, RecordingSink
+from sources import FileSource, MjpegFileSource, ScrcpySource, SyntheticSource
+from stats import StageStats
+
+RESOLUTIONS = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+# raw H.264/H.265 streams go through ScrcpySource's PyAV decoder, everything else through cv2
+ELEMENTARY_STREAMS = (".h264", ".264", ".h265", ".265", ".hevc")
+
+MIRRORS = {
+    "none": (False, False),
+    "x": (True, False),
+    "y": (False, True),
+    "xy": (True, True),
+}
+
+
+class SyntheticBackend:
+    # Stand-in for the real model so the benchmark doesn't need model.pt or torch. Finds the bright
+    # block the SyntheticSource draws with a threshold, then sleeps `cost` seconds to act like inference.
+    def __init__(self, cost=0.03):
+        self.cost = cost
+
+    def detect(self, image):
+        start = time.perf_counter()
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+        points = cv2.findNonZero(mask)
+        box = None
+        if points is not None:
+            x, y, w, h = cv2.boundingRect(points)
+            box = (float(x), float(y), float(x + w), float(y + h))
+
+        remaining = self.cost - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        return box
+
+
+def load_backend(args, kind=None):
+    kind = kind or args.backend
+    if kind == "synthetic":
+        return SyntheticBackend(args.inference_ms / 1000)
+    if not args.model:
+        raise SystemExit(f"--backend {kind} needs --model")
+    return create_backend(kind, args.model, args.infer_size, args.int8, args.threads)
+
+
+def compare_backends(args):
+    # time backend.detect() alone on the same letterboxed frames, against the first backend in the list
+    frames = []
+    source = SyntheticSource(RESOLUTIONS["1080p"], fps=0)
+    for _ in range(16):
+        _, frame = source.read()
+        frames.append(letterbox(frame, args.infer_size)[0])
+
+    print("backend      ms/inference   speedup")
+    baseline = None
+    for kind in args.compare_backends.split(","):
+        backend = load_backend(args, kind)
+        for frame in frames[:5]:
+            backend.detect(frame) # warm up
+        start = time.perf_counter()
+        for i in range(args.iterations):
+            backend.detect(frames[i % len(frames)])
+        ms = (time.perf_counter() - start) / args.iterations * 1000
+        baseline = baseline or ms
+        print(f"{kind:<12} {ms:12.2f}   {baseline / ms:6.2f}x", flush=True)
+
+
+def valid_ratio(ratio):
+    parts = ratio.split(":")
+    try:
+        return len(parts) == 2 and float(parts[0]) > 0 and float(parts[1]) > 0
+    except ValueError:
+        return False
+
+
+def synthetic_jpegs(size, count=60):
+    # the synthetic camera's frames as JPEGs, what an MJPEG webcam would send
+    source = SyntheticSource(size, fps=0)
+    return [cv2.imencode(".jpg", source.read()[1], [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes() for _ in range(count)]
+
+
+def bus_reader(name, stats, running, delay):
+    # a frame bus consumer: copies every frame it gets to, and takes `delay` s to "use" each one
+    reader = FrameBusReader(name)
+    frame = None
+    try:
+        while running.is_set():
+            if not reader.wait(timeout=0.1):
+                continue
+            start = time.perf_counter()
+            skipped, torn = reader.skipped, reader.torn
+            retval, frame = reader.read(frame)
+            if retval:
+                stats.record("bus read", time.perf_counter() - start)
+                stats.record("bus latency", time.perf_counter() - reader.timestamp)
+            stats.count("bus skipped", reader.skipped - skipped)
+            stats.count("bus torn", reader.torn - torn)
+            if delay:
+                time.sleep(delay)
+    finally:
+        reader.release()
+
+
+def run_case(args, case):
+    resolution, interval, ratio, mirror = case
+    size = RESOLUTIONS[resolution]
+
+    if args.source == "synthetic":
+        source = SyntheticSource(size, fps=0 if args.unpaced else args.fps)
+    elif args.source == "mjpeg":
+        source = MjpegFileSource(frames=synthetic_jpegs(size), fps=0 if args.unpaced else args.fps, workers=args.decode_workers)
+    elif args.source.endswith((".mjpeg", ".mjpg")):
+        source = MjpegFileSource(args.source, fps=None if args.unpaced else args.fps, workers=args.decode_workers)
+    elif args.source.endswith(ELEMENTARY_STREAMS):
+        source = ScrcpySource(path=args.source, fps=None if args.unpaced else args.fps)
+    else:
+        source = FileSource(args.source, fps=None if args.unpaced else args.fps)
+    if args.sink == "null":
+        sink = NullSink()
+    else:
+        sink = FileSink(args.sink.format(resolution=resolution, interval=interval, ratio=ratio.replace(":", "x"), mirror=mirror), args.fps)
+
+    processor = FrameProcessor(load_backend(args), infer_size=args.infer_size)
+    processor.detection_interval = interval
+    processor.detector.roi_enabled = not args.no_roi
+    processor.aspect_ratio = ratio
+    processor.mirror_xaxis, processor.mirror_yaxis = MIRRORS[mirror]
+    processor.output_size = size
+
+    stats = StageStats(window=100000)
+    sinks = [sink]
+    readers = []
+    running = threading.Event()
+    if args.bus_readers:
+        sinks.append(FrameBusSink(size[0], size[1], "openphonecam-benchmark"))
+        running.set()
+        readers = [threading.Thread(target=bus_reader, args=("openphonecam-benchmark", stats, running, args.bus_reader_ms * i / 1000),
+                                    daemon=True) for i in range(args.bus_readers)]
+    pipeline = FramePipeline(source, processor, args.fps, sinks=sinks, stats=stats)
+    recorder = None
+    if args.record:
+        path = args.record.replace("{segment", f"{resolution}_{interval}_{ratio.replace(':', 'x')}_{mirror}_{{segment")
+        recorder = RecordingSink(path, args.fps, segment_seconds=args.record_segment, policy=args.record_policy,
+                                 encoder=args.record_encoder, stats=stats)
+        pipeline.attach(recorder)
+    pipeline.start()
+    for reader in readers:
+        reader.start()
+    time.sleep(args.warmup)
+    stats.reset()
+    time.sleep(args.duration)
+    running.clear()
+    for reader in readers:
+        reader.join()
+    summary = stats.summary()
+    pipeline.stop()
+    if recorder is not None:
+        recorder.join()
+        if recorder.error:
+            print(f"recording failed: {recorder.error}", file=sys.stderr)
+
+    stages = summary["stages"]
+    uptime = summary["uptime"]
+    latency = stages.get("latency", {})
+    return {
+        "resolution": resolution,
+        "interval": interval,
+        "ratio": ratio,
+        "mirror": mirror,
+        "output_fps": stages.get("send", {}).get("count", 0) / uptime,
+        "processed_fps": latency.get("count", 0) / uptime,
+        "latency_p50": latency.get("p50"),
+        "latency_p95": latency.get("p95"),
+        "latency_p99": latency.get("p99"),
+        "stages": stages,
+        "counters": summary["counters"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def format_row(result):
+    def ms(value):
+        return f"{value:7.1f}" if value is not None else "      -"
+    transform = result["stages"].get("transform", {}).get("p95")
+    dropped = sum(v for k, v in result["counters"].items() if k.endswith("dropped"))
+    return (
+        f"{result['resolution']:>6} {result['interval']:>3} {result['ratio']:>5} {result['mirror']:>4} | "
+        f"{result['output_fps']:6.1f} {result['processed_fps']:6.1f} | "
+        f"{ms(result['latency_p50'])} {ms(result['latency_p95'])} {ms(result['latency_p99'])} | "
+        f"{ms(transform)} | {dropped:7d} | {result['peak_rss_mb']:7.1f}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark for the Cammy frame pipeline")
+    parser.add_argument("--resolutions", default="480p,720p,1080p", help=f"comma list of {','.join(RESOLUTIONS)}")
+    parser.add_argument("--intervals", default="1", help="comma list of detection intervals")
+    parser.add_argument("--ratios", default="Auto,16:9", help="comma list of aspect ratios (Auto, 16:9, 4:3, 1:1, ...)")
+    parser.add_argument("--mirror", default="none,y", help=f"comma list of {','.join(MIRRORS)}")
+    parser.add_argument("--fps", type=int, default=30, help="output (and source) frame rate")
+    parser.add_argument("--unpaced", action="store_true", help="let the source run as fast as it can instead of at --fps")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds measured per case")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds run before measuring")
+    parser.add_argument("--source", default="synthetic", help="'synthetic', 'mjpeg' (synthetic frames as JPEGs) or a path to a recorded clip/.mjpeg/.h264")
+    parser.add_argument("--decode-workers", type=int, default=None, help="JPEG decode threads for MJPEG sources")
+    parser.add_argument("--sink", default="null", help="'null' or a file path pattern, e.g. out_{resolution}_{mirror}.mp4")
+    parser.add_argument("--bus-readers", type=int, default=0, help="also publish on a shared memory frame bus, read by this many reader threads")
+    parser.add_argument("--bus-reader-ms", type=float, default=0.0, help="reader i spends i times this long per frame, so later ones fall behind and skip")
+    parser.add_argument("--record", default=None, help="also record in the background, path pattern with {segment}, e.g. /tmp/rec_{segment}.mp4")
+    parser.add_argument("--record-segment", type=float, default=0, help="seconds per recording file, 0 = one file")
+    parser.add_argument("--record-policy", default="drop", choices=["drop", "block"], help="what the recorder does when the encoder falls behind")
+    parser.add_argument("--record-encoder", default="auto", choices=["auto", "ffmpeg", "opencv"], help="auto = ffmpeg when installed")
+    parser.add_argument("--backend", default="synthetic", help="synthetic, ultralytics, onnx or openvino (the last three need --model)")
+    parser.add_argument("--model", default=None, help="YOLO weights for the real backends")
+    parser.add_argument("--int8", action="store_true", help="use the INT8 export for onnx/openvino")
+    parser.add_argument("--threads", type=int, default=None, help="inference threads")
+    parser.add_argument("--inference-ms", type=float, default=30.0, help="cost of the synthetic model per call")
+    parser.add_argument("--infer-size", type=int, default=320, help="detector input size, 0 = full frame")
+    parser.add_argument("--no-roi", action="store_true", help="always scan the whole frame instead of the region around the last box")
+    parser.add_argument("--compare-backends", default=None, help="comma list, e.g. ultralytics,onnx,openvino. times inference only, speedup is against the first one")
+    parser.add_argument("--iterations", type=int, default=100, help="inference calls per backend for --compare-backends")
+    parser.add_argument("--json", default=None, help="write the results here as JSON")
+    args = parser.parse_args(argv)
+
+    if args.compare_backends:
+        compare_backends(args)
+        return
+
+    resolutions = args.resolutions.split(",")
+    for resolution in resolutions:
+        if resolution not in RESOLUTIONS:
+            parser.error(f"unknown resolution {resolution!r}, pick from {','.join(RESOLUTIONS)}")
+    mirrors = args.mirror.split(",")
+    for mirror in mirrors:
+        if mirror not in MIRRORS:
+            parser.error(f"unknown mirror {mirror!r}, pick from {','.join(MIRRORS)}")
+    try:
+        intervals = [int(x) for x in args.intervals.split(",")]
+    except ValueError:
+        parser.error(f"--intervals wants whole numbers, got {args.intervals!r}")
+    if min(intervals) < 1:
+        parser.error("detection intervals start at 1")
+    ratios = args.ratios.split(",")
+    for ratio in ratios:
+        if ratio != "Auto" and not valid_ratio(ratio):
+            parser.error(f"bad aspect ratio {ratio!r}, use Auto or w:h like 16:9")
+
+    cases = list(itertools.product(resolutions, intervals, ratios, mirrors))
+
+    print("   res int ratio mirr | out/s  proc/s |  lat p50 lat p95 lat p99 | xform95 | dropped | rss MB")
+    results = []
+    for case in cases:
+        # fresh process per case so the peak RSS belongs to that case only
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_case, args, case).result()
+        results.append(result)
+        print(format_row(result), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import threading
+import numpy as np
+
+
+class PooledFrame:
+    # A numpy frame buffer that goes back to its FramePool once every holder has released it.
+    # Whoever puts a frame somewhere it'll outlive the current call (a queue, the detector, the
+    # preview) calls retain() first and release() when done.
+    def __init__(self, pool, array):
+        self.pool = pool
+        self.array = array
+        self.refs = 1
+        self.timestamp = 0.0 # perf_counter() of the capture this frame came from, for end to end latency
+
+    def retain(self):
+        with self.pool.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self.pool.lock:
+            self.refs -= 1
+            if self.refs == 0:
+                self.pool._recycle(self)
+
+
+class FramePool:
+    # Fixed set of reusable frame buffers, one free list per shape. acquire() hands out a free buffer
+    # and only allocates when all of them are busy, so in steady state nothing gets allocated per
+    # frame. `allocations` counts the times it had to allocate anyway.
+    def __init__(self, max_free=6):
+        self.max_free = max_free # buffers kept around per shape
+        self.lock = threading.Lock()
+        self.free = {}
+        self.allocations = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            buffers = self.free.get(key)
+            if buffers:
+                frame = buffers.pop()
+                frame.refs = 1
+                return frame
+            self.allocations += 1
+        return PooledFrame(self, np.empty(shape, dtype=dtype))
+
+    def adopt(self, array):
+        # wraps an array somebody else allocated (e.g. cv2 when the capture size changed) so it joins the pool
+        return PooledFrame(self, array)
+
+    def _recycle(self, frame):
+        # called with the lock held
+        key = (frame.array.shape, frame.array.dtype)
+        buffers = self.free.setdefault(key, [])
+        if len(buffers) < self.max_free:
+            buffers.append(frame)
+
+    def clear(self):
+        with self.lock:
+            self.free.clear()
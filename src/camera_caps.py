@@ -0,0 +1,250 @@
+import ctypes
+import glob
+import json
+import os
+import time
+
+# What each /dev/video* node can actually do, straight from V4L2 (VIDIOC_ENUM_FMT/FRAMESIZES/
+# FRAMEINTERVALS) instead of opening a VideoCapture and reading CAP_PROP_*, which is slow and only
+# tells you the mode the camera happens to be in right now.
+#
+# Results are cached in ~/.cache/openphonecam/camera_caps.json. An entry is reused as long as the
+# device node is the same one: udev recreates the node when a camera is plugged in again, which
+# changes its ctime, so a replug (or a different camera on the same node) means a fresh probe.
+# Linux only, on anything else discover() just returns {}.
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "openphonecam", "camera_caps.json")
+
+
+class v4l2_capability(ctypes.Structure):
+    _fields_ = [
+        ("driver", ctypes.c_char * 16),
+        ("card", ctypes.c_char * 32),
+        ("bus_info", ctypes.c_char * 32),
+        ("version", ctypes.c_uint32),
+        ("capabilities", ctypes.c_uint32),
+        ("device_caps", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32 * 3),
+    ]
+
+
+class v4l2_fmtdesc(ctypes.Structure):
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("description", ctypes.c_char * 32),
+        ("pixelformat", ctypes.c_uint32),
+        ("mbus_code", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32 * 3),
+    ]
+
+
+class v4l2_frmsize_stepwise(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_uint32) for name in
+                ("min_width", "max_width", "step_width", "min_height", "max_height", "step_height")]
+
+
+class v4l2_frmsize_discrete(ctypes.Structure):
+    _fields_ = [("width", ctypes.c_uint32), ("height", ctypes.c_uint32)]
+
+
+class v4l2_frmsizeenum(ctypes.Structure):
+    class _u(ctypes.Union):
+        _fields_ = [("discrete", v4l2_frmsize_discrete), ("stepwise", v4l2_frmsize_stepwise)]
+
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("pixel_format", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("u", _u),
+        ("reserved", ctypes.c_uint32 * 2),
+    ]
+
+
+class v4l2_fract(ctypes.Structure):
+    _fields_ = [("numerator", ctypes.c_uint32), ("denominator", ctypes.c_uint32)]
+
+
+class v4l2_frmival_stepwise(ctypes.Structure):
+    _fields_ = [("min", v4l2_fract), ("max", v4l2_fract), ("step", v4l2_fract)]
+
+
+class v4l2_frmivalenum(ctypes.Structure):
+    class _u(ctypes.Union):
+        _fields_ = [("discrete", v4l2_fract), ("stepwise", v4l2_frmival_stepwise)]
+
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("pixel_format", ctypes.c_uint32),
+        ("width", ctypes.c_uint32),
+        ("height", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("u", _u),
+        ("reserved", ctypes.c_uint32 * 2),
+    ]
+
+
+def _ioc(direction, nr, struct):
+    return (direction << 30) | (ctypes.sizeof(struct) << 16) | (ord("V") << 8) | nr
+
+
+_READ, _WRITE = 2, 1
+VIDIOC_QUERYCAP = _ioc(_READ, 0, v4l2_capability)
+VIDIOC_ENUM_FMT = _ioc(_READ | _WRITE, 2, v4l2_fmtdesc)
+VIDIOC_ENUM_FRAMESIZES = _ioc(_READ | _WRITE, 74, v4l2_frmsizeenum)
+VIDIOC_ENUM_FRAMEINTERVALS = _ioc(_READ | _WRITE, 75, v4l2_frmivalenum)
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+
+
+def _enumerate(fd, request, struct):
+    # calls an ENUM ioctl with index 0, 1, 2... until the driver says EINVAL
+    import fcntl
+    index = 0
+    while True:
+        struct.index = index
+        try:
+            fcntl.ioctl(fd, request, struct)
+        except OSError:
+            return
+        yield struct
+        index += 1
+
+
+def fourcc_name(code):
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+
+
+def probe_device(path):
+    # returns {"card", "bus_info", "driver", "modes": [{"fourcc", "width", "height", "fps": [...]}]}
+    # or None if the node isn't a capture device
+    import fcntl
+    fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    try:
+        cap = v4l2_capability()
+        fcntl.ioctl(fd, VIDIOC_QUERYCAP, cap)
+        caps = cap.device_caps if cap.capabilities & V4L2_CAP_DEVICE_CAPS else cap.capabilities
+        if not caps & V4L2_CAP_VIDEO_CAPTURE:
+            return None # metadata node, output-only loopback, etc
+
+        modes = []
+        fmt = v4l2_fmtdesc(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        for fmt in _enumerate(fd, VIDIOC_ENUM_FMT, fmt):
+            pixelformat = fmt.pixelformat
+            size = v4l2_frmsizeenum(pixel_format=pixelformat)
+            for size in _enumerate(fd, VIDIOC_ENUM_FRAMESIZES, size):
+                if size.type == V4L2_FRMSIZE_TYPE_DISCRETE:
+                    width, height = size.u.discrete.width, size.u.discrete.height
+                else:
+                    # stepwise/continuous. just offer the biggest size, that's what people want from a webcam
+                    width, height = size.u.stepwise.max_width, size.u.stepwise.max_height
+                rates = []
+                interval = v4l2_frmivalenum(pixel_format=pixelformat, width=width, height=height)
+                for interval in _enumerate(fd, VIDIOC_ENUM_FRAMEINTERVALS, interval):
+                    fract = interval.u.discrete if interval.type == V4L2_FRMIVAL_TYPE_DISCRETE else interval.u.stepwise.min
+                    if fract.numerator:
+                        rates.append(round(fract.denominator / fract.numerator, 2))
+                modes.append({
+                    "fourcc": fourcc_name(pixelformat),
+                    "width": width,
+                    "height": height,
+                    "fps": sorted(set(rates), reverse=True),
+                })
+                if size.type != V4L2_FRMSIZE_TYPE_DISCRETE:
+                    break
+
+        return {
+            "card": cap.card.decode(errors="replace"),
+            "bus_info": cap.bus_info.decode(errors="replace"),
+            "driver": cap.driver.decode(errors="replace"),
+            "modes": modes,
+        }
+    finally:
+        os.close(fd)
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_rdev, st.st_ctime_ns]
+
+
+def discover(cache_path=CACHE_PATH):
+    # {"/dev/video0": caps, ...} for every capture node, from the cache where the node hasn't changed
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    devices = {}
+    fresh = {}
+    changed = False
+    for path in sorted(glob.glob("/dev/video*")):
+        try:
+            stamp = _stamp(path)
+        except OSError:
+            continue
+        entry = cache.get(path)
+        if entry is None or entry.get("stamp") != stamp:
+            try:
+                caps = probe_device(path)
+            except OSError:
+                continue # busy, no permission, unplugged mid-scan...
+            entry = {"stamp": stamp, "caps": caps, "probed": time.time()}
+            changed = True
+        fresh[path] = entry
+        if entry["caps"] is not None:
+            devices[path] = entry["caps"]
+
+    if changed or fresh.keys() != cache.keys():
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "w") as f:
+                json.dump(fresh, f, indent=4)
+        except OSError:
+            pass
+    return devices
+
+
+def resolutions(caps):
+    # "WxH" strings the camera supports, biggest first
+    sizes = {(mode["width"], mode["height"]) for mode in caps["modes"]}
+    return [f"{w}x{h}" for w, h in sorted(sizes, key=lambda s: s[0] * s[1], reverse=True)]
+
+
+def frame_rates(caps, width, height):
+    rates = set()
+    for mode in caps["modes"]:
+        if mode["width"] == width and mode["height"] == height:
+            rates.update(mode["fps"])
+    return sorted(rates, reverse=True)
+
+
+def find_mode(caps, width, height, fps=None):
+    # fourcc that does width x height at (at least) fps, preferring the raw formats that don't need
+    # decoding. None if the camera can't do it at all
+    best = None
+    for mode in caps["modes"]:
+        if mode["width"] != width or mode["height"] != height:
+            continue
+        if fps and not any(rate >= fps - 0.5 for rate in mode["fps"]):
+            continue
+        if best is None or (best == "MJPG" and mode["fourcc"] != "MJPG"):
+            best = mode["fourcc"]
+    return best
+
+
+def best_mode(caps):
+    # (width, height, fps) with the most pixels, then the highest fps
+    best = None
+    for mode in caps["modes"]:
+        fps = mode["fps"][0] if mode["fps"] else 0
+        key = (mode["width"] * mode["height"], fps)
+        if best is None or key > best[0]:
+            best = (key, (mode["width"], mode["height"], fps))
+    return best[1] if best else None
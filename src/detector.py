@@ -0,0 +1,272 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+from pipeline import LatestQueue
+from stats import StageStats
+
+# Frames stay in whatever format the source hands out (see sources.py). The model wants BGR numpy
+# arrays, so this is the only place a colour conversion happens, on the small letterboxed copy.
+TO_BGR = {"BGR": None, "RGB": cv2.COLOR_RGB2BGR}
+TO_GRAY = {"BGR": cv2.COLOR_BGR2GRAY, "RGB": cv2.COLOR_RGB2GRAY}
+
+
+def letterbox(frame, size):
+    # Shrinks the frame so its long side is `size` and pads the rest with gray, the same way YOLO
+    # does it internally. Returns the square image plus (scale, pad_x, pad_y) so boxes can be mapped back.
+    h, w = frame.shape[:2]
+    scale = min(size / w, size / h)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+
+    image = np.full((size, size, frame.shape[2]), 114, dtype=frame.dtype)
+    image[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return image, (scale, pad_x, pad_y)
+
+
+def unletterbox_box(box, transform, frame_shape):
+    # maps an (x1, y1, x2, y2) box from letterboxed coordinates back onto the source frame
+    scale, pad_x, pad_y = transform
+    h, w = frame_shape[:2]
+    x1, y1, x2, y2 = box
+    x1 = min(max((x1 - pad_x) / scale, 0), w)
+    x2 = min(max((x2 - pad_x) / scale, 0), w)
+    y1 = min(max((y1 - pad_y) / scale, 0), h)
+    y2 = min(max((y2 - pad_y) / scale, 0), h)
+    return int(x1), int(y1), int(x2), int(y2)
+
+
+def roi_around(box, frame_shape, margin):
+    # box grown by `margin` times its size on every side (room for the subject to move before the
+    # next detection), clipped to the frame. (x1, y1, x2, y2) ints
+    h, w = frame_shape[:2]
+    x1, y1, x2, y2 = box
+    grow = margin * max(x2 - x1, y2 - y1)
+    return (
+        int(max(0, x1 - grow)),
+        int(max(0, y1 - grow)),
+        int(min(w, x2 + grow)),
+        int(min(h, y2 + grow)),
+    )
+
+
+class MotionGate:
+    # Cheap "did anything change" check that runs before the model.
+    # Each frame is shrunk to a tiny grayscale thumbnail and compared with the thumbnail from the last
+    # time the model actually ran. If the mean difference is under threshold (0-255 scale) and the last
+    # real detection isn't older than max_staleness seconds, the model call is skipped.
+    def __init__(self, threshold=3.0, max_staleness=1.0, thumb_size=(32, 18)):
+        self.threshold = threshold
+        self.max_staleness = max_staleness
+        self.thumb_size = thumb_size
+        self.executed = 0 # model calls that actually ran
+        self.skipped = 0  # model calls saved by the gate
+        self.pixel_format = "BGR"
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.reference_time = None
+
+    def should_run(self, frame, now):
+        thumb = cv2.resize(frame, self.thumb_size, interpolation=cv2.INTER_AREA)
+        thumb = cv2.cvtColor(thumb, TO_GRAY[self.pixel_format]) if thumb.ndim == 3 else thumb
+
+        if (self.reference is not None
+                and now - self.reference_time < self.max_staleness
+                and cv2.absdiff(thumb, self.reference).mean() < self.threshold):
+            self.skipped += 1
+            return False
+
+        self.reference = thumb
+        self.reference_time = now
+        self.executed += 1
+        return True
+
+
+class DetectorWorker:
+    # Runs the model on its own thread so inference never blocks a frame.
+    # submit() drops the frame into a one-slot LatestQueue, so the worker always picks up the newest
+    # frame and whatever it couldn't keep up with is skipped. That means the detection rate is simply
+    # however fast inference runs on this machine.
+    # Frames come in as PooledFrames the caller already retained; the worker releases them.
+    # backend is anything with detect(image) -> box, see backends.py.
+    def __init__(self, backend, infer_size=320):
+        self.backend = backend
+        self.infer_size = infer_size # long side in px the model sees. we only need a rough person location, 0 = full frame
+        self.gate = MotionGate()     # skips the model when the scene hasn't changed, see gate.executed / gate.skipped
+        # Tracking mode: once somebody's found, the model only looks at a region around the last box
+        # (roi_around, roi_margin) and at a proportionally smaller input size, so the person is the same
+        # size to the model as in a full scan. Every full_scan_interval-th detection, and whenever the
+        # region comes back empty, the whole frame gets scanned again.
+        self.roi_enabled = True
+        self.roi_margin = 0.3
+        self.full_scan_interval = 15
+        self.since_full_scan = 0
+        self.last_box = None
+        self.pixel_format = "BGR"
+        self.stats = StageStats(enabled=False)
+        self.queue = LatestQueue(maxsize=1, on_drop=self._dropped)
+        self.lock = threading.Lock()
+        self.result = None          # (timestamp, box) of the newest finished detection, box is None if nobody was found
+        self.inference_time = None  # moving average of seconds per inference
+        self.running = False
+        self.thread = None
+
+    def start(self, pixel_format="BGR", stats=None):
+        if stats is not None:
+            self.stats = stats
+        self.pixel_format = pixel_format
+        self.gate.pixel_format = pixel_format
+        self.queue = LatestQueue(maxsize=1, on_drop=self._dropped)
+        self.gate.reset()
+        self.last_box = None
+        self.since_full_scan = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="cammy-detector", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.queue.close()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def reset(self):
+        # forget the subject (e.g. the frame size changed). results already on their way are the caller's problem
+        self.last_box = None
+        self.since_full_scan = 0
+        self.gate.reset()
+
+    def submit(self, frame, timestamp):
+        self.queue.put((frame, timestamp))
+
+    def _dropped(self, item):
+        self.stats.count("detector dropped")
+        item[0].release()
+
+    def take_result(self):
+        # returns the newest result once, then None until the next detection finishes
+        with self.lock:
+            result, self.result = self.result, None
+        return result
+
+    def size_adjustable(self):
+        # exported models only take the input size they were built for (see backends.py)
+        return not getattr(self.backend, "fixed_size", False)
+
+    def detection_fps(self):
+        if not self.inference_time:
+            return 0.0
+        return 1.0 / self.inference_time
+
+    def _run(self):
+        while self.running:
+            item = self.queue.get(timeout=0.1)
+            if item is None:
+                continue
+            pooled, timestamp = item
+            frame = pooled.array
+
+            if not self.gate.should_run(frame, time.perf_counter()):
+                # nothing moved. hand the old box back with the new timestamp so the tracker holds still
+                box = self.last_box
+                self.stats.count("motion skipped")
+            else:
+                start = time.perf_counter()
+                box = self.track(frame)
+                elapsed = time.perf_counter() - start
+                if self.inference_time is None:
+                    self.inference_time = elapsed
+                else:
+                    self.inference_time = 0.8 * self.inference_time + 0.2 * elapsed
+                self.last_box = box
+            pooled.release()
+
+            with self.lock:
+                self.result = (timestamp, box)
+
+    def track(self, frame):
+        # region around the last box when we have one, the whole frame otherwise
+        if self.roi_enabled and self.last_box is not None and self.since_full_scan < self.full_scan_interval:
+            self.since_full_scan += 1
+            roi = roi_around(self.last_box, frame.shape, self.roi_margin)
+            box = self.detect(frame, roi) if min(roi[2] - roi[0], roi[3] - roi[1]) >= 16 else None
+            if box is not None:
+                self.stats.count("roi scans")
+                return box
+            self.stats.count("roi lost") # walked out of the region (or out of the frame), look everywhere
+        self.since_full_scan = 0
+        self.stats.count("full scans")
+        return self.detect(frame)
+
+    def detect(self, frame, roi=None):
+        start = time.perf_counter()
+        conversion = TO_BGR[self.pixel_format]
+        transform = None
+        image = frame
+        size = self.infer_size
+        if roi is not None:
+            x1, y1, x2, y2 = roi
+            image = frame[y1:y2, x1:x2] # view, letterbox() makes the copy
+            if size and self.size_adjustable():
+                # keep the model's scale the same as a full scan: shrink the input by the roi/frame ratio.
+                # multiple of 32 for YOLO's strides
+                ratio = max(x2 - x1, y2 - y1) / max(frame.shape[:2])
+                size = min(size, max(64, -(-int(size * ratio) // 32) * 32))
+        if size:
+            image, transform = letterbox(image, size)
+        if conversion is not None:
+            image = cv2.cvtColor(image, conversion)
+        self.stats.record("convert", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        box = self.backend.detect(image)
+        self.stats.record("inference", time.perf_counter() - start)
+
+        if box is not None and transform is not None:
+            box = unletterbox_box(box, transform, frame.shape if roi is None else (y2 - y1, x2 - x1))
+        if box is not None and roi is not None:
+            box = (box[0] + x1, box[1] + y1, box[2] + x1, box[3] + y1) # back to frame coordinates
+        return box
+
+
+class CenterTracker:
+    # Keeps the crop center moving smoothly between detections.
+    # Every detection is stamped with the time its frame was captured. From the last two we get a
+    # velocity and extrapolate the center forward, then ease the displayed center towards that
+    # prediction so a new detection doesn't make the crop jump.
+    def __init__(self, smoothing=0.35, max_extrapolation=0.5):
+        self.smoothing = smoothing                  # 0..1, how much of the gap to the prediction we close per frame
+        self.max_extrapolation = max_extrapolation  # seconds. dont keep sliding forever if detections stop coming
+        self.reset()
+
+    def reset(self):
+        self.last = None        # (t, cx, cy) of the newest detection
+        self.velocity = (0.0, 0.0)
+        self.cx = None
+        self.cy = None
+
+    def update(self, timestamp, cx, cy):
+        if self.last is not None:
+            t0, x0, y0 = self.last
+            dt = timestamp - t0
+            if dt > 0:
+                self.velocity = ((cx - x0) / dt, (cy - y0) / dt)
+        else:
+            self.cx, self.cy = float(cx), float(cy)
+        self.last = (timestamp, cx, cy)
+
+    def predict(self, now):
+        if self.last is None:
+            return None
+        t, x, y = self.last
+        dt = min(max(0.0, now - t), self.max_extrapolation)
+        target_x = x + self.velocity[0] * dt
+        target_y = y + self.velocity[1] * dt
+
+        self.cx += (target_x - self.cx) * self.smoothing
+        self.cy += (target_y - self.cy) * self.smoothing
+        return int(self.cx), int(self.cy)
@@ -0,0 +1,104 @@
+import socket
+import subprocess
+import threading
+from PyQt6 import QtCore
+
+from adb_client import AdbClient, parse_devices, read_block
+
+
+class DeviceTracker(QtCore.QObject):
+    # Keeps one host:track-devices connection open to the adb server. The server pushes the full
+    # device list every time something changes; we diff it against the last one and emit
+    # added/removed/state changed. No polling and no adb process per update.
+    # Runs on its own thread, the signals get delivered on the GUI thread.
+    # If the server isn't running (or gets killed) it tries starting it once per outage and keeps
+    # reconnecting, backing off up to max_retry_interval. An outage is reported once, not every retry.
+    deviceAdded = QtCore.pyqtSignal(str, str)        # serial, state
+    deviceRemoved = QtCore.pyqtSignal(str)           # serial
+    deviceStateChanged = QtCore.pyqtSignal(str, str) # serial, new state
+    trackerError = QtCore.pyqtSignal(str)
+
+    def __init__(self, parent=None, client=None, retry_interval=1.0, max_retry_interval=30.0):
+        super().__init__(parent)
+        self.client = client or AdbClient()
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.devices = {} # serial -> state, as of the last update. only written on the tracker thread
+        self.running = False
+        self.sock = None
+        self.thread = None
+        self.wake = threading.Event() # cuts a retry wait short on stop()
+
+    def start(self):
+        self.running = True
+        self.wake.clear()
+        self.thread = threading.Thread(target=self._run, name="adb-tracker", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR) # unblocks the recv on the tracker thread, close() alone doesn't on linux
+            except OSError:
+                pass
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def _run(self):
+        started_server = False # this outage
+        reported = None        # the error this outage was reported with, retries stay quiet
+        delay = self.retry_interval
+        while self.running:
+            error = None
+            try:
+                self.sock = self.client.connect()
+                self.sock.settimeout(None) # updates only come when something changes
+                self.client.request(self.sock, "host:track-devices")
+                while self.running:
+                    devices = parse_devices(read_block(self.sock).decode(errors="replace"))
+                    # a device list means the server really is up, the outage is over
+                    if reported:
+                        self.trackerError.emit("adb server is back, tracking devices again")
+                    started_server, reported, delay = False, None, self.retry_interval
+                    self._update(devices)
+            except ConnectionRefusedError:
+                if not started_server:
+                    started_server = True
+                    self._start_server()
+                    continue
+                error = "adb server is not running"
+            except (OSError, ValueError) as e:
+                error = f"adb tracking connection lost: {e}"
+            finally:
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+            if not self.running:
+                break
+            if error and reported is None:
+                self.trackerError.emit(error)
+                reported = error
+            self.wake.wait(delay)
+            delay = min(delay * 2, self.max_retry_interval)
+
+    def _start_server(self):
+        try:
+            subprocess.run(["adb", "start-server"], capture_output=True, timeout=10)
+        except (OSError, subprocess.SubprocessError) as e:
+            self.trackerError.emit(f"could not start adb server: {e}")
+
+    def _update(self, devices):
+        old = self.devices
+        self.devices = devices
+        for serial in old:
+            if serial not in devices:
+                self.deviceRemoved.emit(serial)
+        for serial, state in devices.items():
+            if serial not in old:
+                self.deviceAdded.emit(serial, state)
+            elif old[serial] != state:
+                self.deviceStateChanged.emit(serial, state)
@@ -0,0 +1,186 @@
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+# Output frames in shared memory, for anything besides the virtual cam that wants them (a recorder, a
+# second virtual cam, an analytics process) without another copy in the pipeline per consumer.
+#
+# The producer writes each frame once into a ring of `slots` fixed size slots. Every slot has its own
+# sequence number used as a seqlock: odd while the producer is writing it, even once it's done. A
+# reader copies the newest slot out and checks the sequence didn't move while it was copying, if it
+# did the producer lapped it and it tries again with whatever is newest now. The producer never waits
+# for anybody, a slow reader just skips frames (FrameBusReader.skipped counts them).
+#
+# Layout of the shared memory block, all uint64:
+#   header       magic, slots, slot_bytes, number of the last published frame, pid of the producer
+#   slot table   per slot: seq, frame number, height, width, channels, timestamp (perf_counter_ns)
+#   data         slots * slot_bytes
+
+MAGIC = 0x4F50434642555331 # "OPCFBUS1"
+HEADER = 5
+SLOT_FIELDS = 6
+DEFAULT_NAME = "openphonecam"
+
+_published = set() # names of the buses this process owns
+
+
+def _layout(buf, slots, slot_bytes):
+    header = np.ndarray((HEADER,), np.uint64, buf)
+    table = np.ndarray((slots, SLOT_FIELDS), np.uint64, buf, offset=HEADER * 8)
+    data_offset = (HEADER + slots * SLOT_FIELDS) * 8
+    data = np.ndarray((slots, slot_bytes), np.uint8, buf, offset=data_offset)
+    return header, table, data
+
+
+class FrameBus:
+    # producer side. owns the shared memory, unlinks it on close()
+    def __init__(self, max_frame_bytes, name=DEFAULT_NAME, slots=4):
+        self.slots = slots
+        self.slot_bytes = max_frame_bytes
+        size = (HEADER + slots * SLOT_FIELDS) * 8 + slots * max_frame_bytes
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            _remove_stale(name) # raises if another process is still publishing on it
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name = name
+        _published.add(name)
+        self.header, self.table, self.data = _layout(self.shm.buf, slots, max_frame_bytes)
+        self.table[:] = 0
+        self.header[:] = (MAGIC, slots, max_frame_bytes, 0, os.getpid())
+        self.published = 0
+
+    def publish(self, frame, timestamp=None):
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"frame of {frame.nbytes} bytes doesn't fit the bus slots ({self.slot_bytes})")
+        number = self.published + 1
+        slot = self.table[number % self.slots]
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        slot[0] += 1 # odd: being written
+        target = self.data[number % self.slots, :frame.nbytes].reshape(frame.shape)
+        np.copyto(target, frame)
+        slot[1:] = (number, height, width, channels, time.perf_counter_ns() if timestamp is None else int(timestamp * 1e9))
+        slot[0] += 1 # even: done
+        self.header[3] = number
+        self.published = number
+
+    def close(self):
+        self.header[0] = 0 # readers still attached see it's gone (FrameBusReader.closed)
+        # the arrays point into the buffer, they have to go before it can be closed
+        self.header = self.table = self.data = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        _published.discard(self.name)
+
+
+class FrameBusReader:
+    # consumer side, in this process or another one. read() works like a source's, so a reader can
+    # be a FramePipeline source too (e.g. a recorder process running its own pipeline)
+    pixel_format = "BGR"
+
+    def __init__(self, name=DEFAULT_NAME, retries=3):
+        self.shm = _attach(name)
+        header = np.ndarray((HEADER,), np.uint64, self.shm.buf)
+        if int(header[0]) != MAGIC:
+            self.shm.close()
+            raise ValueError(f"{name} is not a frame bus")
+        self.slots, self.slot_bytes = int(header[1]), int(header[2])
+        del header
+        self.header, self.table, self.data = _layout(self.shm.buf, self.slots, self.slot_bytes)
+        self.retries = retries
+        self.last = int(self.header[3]) # start from what's published now, not from old frames
+        self.skipped = 0 # published frames this reader never saw
+        self.torn = 0    # copies thrown away because the producer overwrote the slot mid copy
+        self.timestamp = 0.0
+
+    def read(self, out=None):
+        # newest frame not read yet as (True, frame), or (False, None) if there's nothing new
+        for _ in range(self.retries):
+            number = int(self.header[3])
+            if number == self.last:
+                return False, None
+            slot = self.table[number % self.slots]
+            seq = int(slot[0])
+            if seq % 2 or int(slot[1]) != number:
+                continue # being rewritten already
+            height, width, channels = (int(v) for v in slot[2:5])
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            if out is None or out.shape != shape:
+                out = np.empty(shape, np.uint8)
+            np.copyto(out, self.data[number % self.slots, :out.nbytes].reshape(shape))
+            if int(slot[0]) != seq:
+                self.torn += 1
+                continue
+            self.skipped += number - self.last - 1
+            self.last = number
+            self.timestamp = int(slot[5]) / 1e9
+            return True, out
+        return False, None
+
+    @property
+    def closed(self):
+        # the producer went away (or restarted the bus, e.g. for a new resolution). open a new reader
+        return int(self.header[0]) != MAGIC
+
+    def wait(self, timeout=1.0, poll=0.002):
+        # blocks until there's a frame read() hasn't returned yet, False on timeout
+        deadline = time.monotonic() + timeout
+        while int(self.header[3]) == self.last:
+            if time.monotonic() > deadline or self.closed:
+                return False
+            time.sleep(poll)
+        return True
+
+    def release(self):
+        self.header = self.table = self.data = None
+        self.shm.close()
+
+
+def _remove_stale(name):
+    # a bus with this name is already there. it's only stale if the process that created it is gone
+    # (crashed without close()), a live one belongs to another instance and isn't ours to take
+    shm = _attach(name)
+    try:
+        header = np.ndarray((HEADER,), np.uint64, shm.buf) if shm.size >= HEADER * 8 else None
+        magic, pid = (int(header[0]), int(header[4])) if header is not None else (0, 0)
+        del header
+    finally:
+        shm.close()
+    if magic not in (0, MAGIC):
+        raise FileExistsError(f"shared memory {name!r} exists and isn't a frame bus")
+    if magic == MAGIC and (pid == os.getpid() or _alive(pid)):
+        raise FileExistsError(f"frame bus {name!r} is already published by process {pid}")
+    stale = shared_memory.SharedMemory(name)
+    stale.close()
+    stale.unlink()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # someone else's process
+    return True
+
+
+def _attach(name):
+    # attach without the resource tracker, which would otherwise unlink the producer's memory when
+    # this process exits (python < 3.13 registers attached blocks too). a bus published by this same
+    # process is registered by its owner already, and unlink() unregisters it
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name)
+        if name not in _published:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
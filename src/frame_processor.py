@@ -0,0 +1,85 @@
+import time
+
+from detector import CenterTracker, DetectorWorker
+from geometry import GeometryPlan
+from stats import StageStats
+
+
+class FrameProcessor:
+    # Everything that happens to a frame between the camera and the outputs: detection, crop,
+    # aspect ratio and mirroring. No Qt in here so it can run on the pipeline's processing thread.
+    def __init__(self, backend, infer_size=320):
+        self.detector = DetectorWorker(backend, infer_size) # runs the model on its own thread, see detector.py
+        self.tracker = CenterTracker()        # smooths/extrapolates the center between detections
+        self.detection_interval = 1 # offer every nth frame to the detector. it already skips frames it can't keep up with, so 1 is fine on most machines
+        self.frame_count = 0        # counts frames.
+        self.last_cx = None         # saves previous center position - x
+        self.last_cy = None         # saves previous center position - y
+
+        self.aspect_ratio = None
+        self.mirror_xaxis = False
+        self.mirror_yaxis = False
+        self.output_size = None # (w, h) the frames come out at, normally the virtual cam resolution. None keeps the crop size
+        self.plan = None        # cached GeometryPlan, rebuilt when crop/ratio/mirror/size change
+        self.frame_size = None  # (w, h) of the input. when it changes mid-run (capture reconfigured) tracking starts over
+        self.size_changed_at = 0.0
+        self.stats = StageStats(enabled=False)
+
+    def start(self, pixel_format="BGR", stats=None):
+        if stats is not None:
+            self.stats = stats
+        self.tracker.reset()
+        self.last_cx = None
+        self.last_cy = None
+        self.frame_size = None
+        self.detector.start(pixel_format, self.stats)
+
+    def stop(self):
+        self.detector.stop()
+
+    def process(self, captured):
+        # takes a PooledFrame in the source's pixel format and returns a PooledFrame in that same format
+        # that the caller owns. captured stays owned by the caller. No colour conversion here, the
+        # detector does its own on the small inference copy if it needs one
+        pool = captured.pool
+        frame = captured.retain()
+
+        now = time.perf_counter()
+        h, w = frame.array.shape[:2]
+        if self.frame_size != (w, h):
+            if self.frame_size is not None:
+                # new capture mode. old centers and boxes are in the old frame's coordinates
+                self.tracker.reset()
+                self.detector.reset()
+                self.last_cx = None
+                self.last_cy = None
+                self.size_changed_at = now
+            self.frame_size = (w, h)
+
+        self.frame_count += 1
+        if self.frame_count % self.detection_interval == 0:
+            self.detector.submit(frame.retain(), now)
+
+        result = self.detector.take_result()
+        if result is not None and result[1] is not None and result[0] >= self.size_changed_at:
+            timestamp, (x1, y1, x2, y2) = result
+            self.tracker.update(timestamp, (x1 + x2) // 2, (y1 + y2) // 2) # mid point
+
+        center = self.tracker.predict(now)
+        if center is not None:
+            self.last_cx, self.last_cy = center
+
+        key = ((w, h), center, self.aspect_ratio, self.mirror_xaxis, self.mirror_yaxis, self.output_size)
+        if self.plan is None or self.plan.key != key:
+            self.plan = GeometryPlan(*key)
+        if self.plan.passthrough:
+            return frame # nothing to crop/flip/resize, hand the same buffer on
+
+        start = time.perf_counter()
+        out_w, out_h = self.plan.output_size
+        output = pool.acquire((out_h, out_w, frame.array.shape[2]))
+        output.timestamp = frame.timestamp
+        self.plan.apply(frame.array, dst=output.array)
+        frame.release()
+        self.stats.record("transform", time.perf_counter() - start)
+        return output
@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+
+
+def center_crop_rect(w, h, cx, cy):
+    # suppose values of cx cy and everythin else. U wil understand.
+    crop_w = int(w/2)
+    crop_h = int(h/2)
+
+    x1 = max(0, cx - crop_w//2)
+    y1 = max(0, cy - crop_h//2)
+
+    x2 = min(w, x1 + crop_w)
+    y2 = min(h, y1 + crop_h)
+
+    return x1, y1, x2, y2
+
+
+def ratio_crop_rect(rect, aspect_ratio):
+    x1, y1, x2, y2 = rect
+    w, h = x2 - x1, y2 - y1
+    parts = aspect_ratio.split(":")
+    target_ratio = float(parts[0]) / float(parts[1])
+    current_ratio = w / h
+
+    if current_ratio > target_ratio:
+        new_w  = int(h * target_ratio)
+        offset = (w - new_w) // 2
+        return x1 + offset, y1, x1 + offset + new_w, y2
+    else:
+        new_h  = int(w / target_ratio)
+        offset = (h - new_h) // 2
+        return x1, y1 + offset, x2, y1 + offset + new_h
+
+
+class GeometryPlan:
+    # Crop, aspect ratio, mirror and output resize folded into one transform, so each frame is read
+    # once and written straight into the output buffer: a slice view of the crop, cv2.resize into dst,
+    # and if mirrored a flip of dst in place (or a straight flip into dst when there's nothing to resize).
+    # A single warpAffine with the flip in its matrix sounds nicer but is slower than resize + in-place
+    # flip, warpAffine doesn't get resize's fast paths.
+    # Building a plan is just a bit of arithmetic; FrameProcessor keeps the last one and only makes a
+    # new one when the key (frame size, center, ratio, mirror flags, output size) changes.
+    def __init__(self, frame_size, center, aspect_ratio, mirror_xaxis, mirror_yaxis, output_size):
+        w, h = frame_size
+        self.key = (frame_size, center, aspect_ratio, mirror_xaxis, mirror_yaxis, output_size)
+
+        rect = (0, 0, w, h)
+        if center is not None:
+            rect = center_crop_rect(w, h, center[0], center[1])
+        if aspect_ratio and aspect_ratio != "Auto":
+            rect = ratio_crop_rect(rect, aspect_ratio)
+        self.rect = rect
+        self.output_size = output_size or (rect[2] - rect[0], rect[3] - rect[1]) # no output size: crop size, nothing scaled
+        self.mirror_xaxis = mirror_xaxis
+        self.mirror_yaxis = mirror_yaxis
+
+        self.flip_code = None
+        if mirror_xaxis and mirror_yaxis:
+            self.flip_code = -1
+        elif mirror_xaxis:
+            self.flip_code = 0
+        elif mirror_yaxis:
+            self.flip_code = 1
+
+        self.resize = not (rect == (0, 0, w, h) and self.output_size == (w, h))
+        self.passthrough = not self.resize and self.flip_code is None
+
+    def apply(self, frame, dst=None):
+        if self.passthrough:
+            if dst is None:
+                return frame
+            np.copyto(dst, frame)
+            return dst
+
+        out_w, out_h = self.output_size
+        if dst is None:
+            dst = np.empty((out_h, out_w, frame.shape[2]), dtype=frame.dtype)
+
+        if not self.resize:
+            cv2.flip(frame, self.flip_code, dst=dst)
+            return dst
+
+        x1, y1, x2, y2 = self.rect
+        cv2.resize(frame[y1:y2, x1:x2], (out_w, out_h), dst=dst, interpolation=cv2.INTER_LINEAR)
+        if self.flip_code is not None:
+            cv2.flip(dst, self.flip_code, dst=dst)
+        return dst
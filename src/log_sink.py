@@ -0,0 +1,90 @@
+import collections
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from PyQt6 import QtCore, QtGui
+
+# Log lines for a QTextEdit that can't swamp the GUI: write() only queues the line in a ring buffer,
+# and a timer puts whatever queued up into the document in one edit, flush_interval ms at a time.
+# The document keeps at most max_lines blocks, older ones are dropped as new ones come in. If more
+# than max_lines arrive between two flushes only the newest make it to the screen, but every line
+# still goes to the rotating log file, so nothing is lost and memory stays flat however long it runs.
+# The file is written by a QueueListener thread, write() only hands the record over, so the disk
+# write (and the rollover check) never happen on the GUI thread.
+
+LOG_PATH = os.path.join(os.path.expanduser("~"), ".cache", "openphonecam", "scrcpy.log")
+
+
+class LogSink(QtCore.QObject):
+    def __init__(self, text_edit, max_lines=2000, flush_interval=100, log_path=LOG_PATH,
+                 max_bytes=5 * 1024 * 1024, backups=3, name="openphonecam.terminal"):
+        super().__init__(text_edit)
+        self.text_edit = text_edit
+        self.text_edit.document().setMaximumBlockCount(max_lines)
+        self.pending = collections.deque(maxlen=max_lines)
+        self.skipped = 0 # lines that fell out of the ring buffer before a flush, file has them anyway
+
+        self.logger = logging.getLogger(name)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.file_handler = None
+        self.queue_handler = None
+        self.listener = None
+        if log_path:
+            try:
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                self.file_handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            except OSError:
+                pass # no file log then, the pane still works
+        if self.file_handler is not None:
+            # asctime comes from when the line was logged, not when the listener gets to it
+            self.file_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            records = queue.SimpleQueue()
+            self.queue_handler = QueueHandler(records)
+            self.logger.addHandler(self.queue_handler)
+            self.listener = QueueListener(records, self.file_handler)
+            self.listener.start()
+
+        self.flushTimer = QtCore.QTimer(self)
+        self.flushTimer.setInterval(flush_interval)
+        self.flushTimer.timeout.connect(self.flush)
+        self.flushTimer.start()
+
+    def write(self, line):
+        if len(self.pending) == self.pending.maxlen:
+            self.skipped += 1
+        self.pending.append(line)
+        self.logger.info(line)
+
+    def flush(self):
+        if not self.pending:
+            return
+        lines = list(self.pending)
+        self.pending.clear()
+        if self.skipped:
+            lines.insert(0, f"... {self.skipped} lines skipped, see {self.log_file() or 'the log file'}")
+            self.skipped = 0
+
+        scrollbar = self.text_edit.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        cursor = QtGui.QTextCursor(self.text_edit.document())
+        cursor.movePosition(QtGui.QTextCursor.MoveOperation.End)
+        # one insert for the whole batch = one layout pass. plain text, scrcpy output isn't html
+        if not self.text_edit.document().isEmpty():
+            lines.insert(0, "")
+        cursor.insertText("\n".join(lines))
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def log_file(self):
+        return self.file_handler.baseFilename if self.file_handler is not None else None
+
+    def close(self):
+        self.flushTimer.stop()
+        self.flush()
+        if self.listener is not None:
+            self.logger.removeHandler(self.queue_handler)
+            self.listener.stop() # writes out whatever is still queued
+            self.file_handler.close()
+            self.listener = None
@@ -0,0 +1,270 @@
+import threading
+import time
+from collections import deque
+
+from buffer_pool import FramePool
+from stats import StageStats
+
+
+class LatestQueue:
+    # Bounded hand-off between two pipeline stages. When it's full, put() throws away the oldest
+    # item instead of blocking, so a slow consumer never holds up the stage in front of it
+    # (latest frame wins). dropped counts how many frames got thrown away like that, on_drop gets
+    # called with each of them (used to hand pooled buffers back).
+    def __init__(self, maxsize=1, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.items = deque()
+        self.dropped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        dropped = None
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                dropped = self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        # returns None on timeout or once the queue is closed and empty
+        with self.cond:
+            if not self.items and not self.closed:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            leftovers = list(self.items)
+            self.items.clear()
+            self.cond.notify_all()
+        if self.on_drop is not None:
+            for item in leftovers:
+                self.on_drop(item)
+
+
+class FramePipeline:
+    # capture thread -> processing thread -> output thread, joined by LatestQueues.
+    # The output thread runs on its own clock at `fps` and re-sends the last frame when processing
+    # falls behind, so the virtual cam keeps its frame rate even if the model hiccups.
+    # Nothing in here touches Qt. The GUI gets preview frames through on_preview, which is called
+    # from the output thread (TabCammy turns it into a signal).
+    # Frames travel as PooledFrames from one FramePool, end to end: capture reads into a pooled buffer,
+    # the processor writes into another one and the sinks read that same buffer. The callback gets
+    # the PooledFrame itself and has to retain() it if it keeps it past the call.
+    # Stage timings and dropped/repeated frame counts go into stats (see stats.py).
+    # reconfigure() changes things while it runs: fps just changes the output clock, a new source or
+    # new sinks get swapped in by the thread that owns them (see reconfigure).
+    def __init__(self, source, processor, fps, sinks=(), on_preview=None, stats=None, on_error=None):
+        self.source = source
+        self.processor = processor
+        self.fps = fps
+        self.sinks = list(sinks)
+        self.attached = [] # sinks added with attach(), kept when reconfigure() replaces self.sinks
+        self.on_preview = on_preview
+        self.on_error = on_error # called with a message from a pipeline thread when a reconfigure fails
+        self.stats = stats if stats is not None else StageStats(enabled=False)
+
+        self.reconfig_lock = threading.Lock()
+        self.pending_source = None   # factory for the next source, picked up by the capture thread
+        self.pending_sinks = None    # factory for the next sinks, picked up by the output thread
+        self.reconfig_started = None # perf_counter() of the change in progress, None when there's none
+        self.reconfig_ready = None   # frames captured from this time on show the new configuration
+
+        self.pool = FramePool()
+        self.capture_queue = LatestQueue(maxsize=1, on_drop=self._dropped("capture dropped"))
+        self.output_queue = LatestQueue(maxsize=1, on_drop=self._dropped("output dropped"))
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        self.processor.start(self.source.pixel_format, self.stats)
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="cammy-capture", daemon=True),
+            threading.Thread(target=self._process_loop, name="cammy-process", daemon=True),
+            threading.Thread(target=self._output_loop, name="cammy-output", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        self.capture_queue.close()
+        self.output_queue.close()
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+        self.processor.stop()
+        self.pool.clear()
+
+        self.source.release()
+        for sink in self.sinks + self.attached:
+            sink.close()
+
+    def reconfigure(self, source_factory=None, sinks_factory=None, fps=None, started=None):
+        # Applies a settings change without stopping anything.
+        #   fps            output pacing, next frame
+        #   source_factory () -> new source. the capture thread releases the old source first and then
+        #                  calls it, so a camera can be reopened in a different mode on the same device
+        #   sinks_factory  () -> list of new sinks, same deal on the output thread (virtual cam format change)
+        # The time from `started` to the first frame sent with everything in place is recorded as the
+        # "reconfigure" stage.
+        with self.reconfig_lock:
+            self.reconfig_started = started or time.perf_counter()
+            if source_factory is not None:
+                self.pending_source = source_factory
+                self.reconfig_ready = float("inf") # until the capture thread has the new source up
+            elif self.pending_source is None:
+                self.reconfig_ready = self.reconfig_started
+            if sinks_factory is not None:
+                self.pending_sinks = sinks_factory
+            if fps:
+                self.fps = fps
+
+    def attach(self, sink):
+        # adds a sink while running, e.g. a recording. it gets frames from the next one on
+        with self.reconfig_lock:
+            self.attached = self.attached + [sink]
+
+    def detach(self, sink):
+        # takes an attached sink out again. the output thread can still be inside its send() for the
+        # current frame, so close() it from here only if it can deal with that (RecordingSink can)
+        with self.reconfig_lock:
+            self.attached = [s for s in self.attached if s is not sink]
+
+    def _error(self, message):
+        self.stats.count("reconfigure failed")
+        if self.on_error is not None:
+            self.on_error(message)
+
+    def _swap_source(self):
+        with self.reconfig_lock:
+            factory, self.pending_source = self.pending_source, None
+        self.source.release() # the device has to be free before it can be opened in the new mode
+        try:
+            self.source = factory()
+        except Exception as e:
+            self.source = _ClosedSource()
+            self._error(f"Could not reopen the capture: {e}")
+        with self.reconfig_lock:
+            if self.pending_source is None:
+                self.reconfig_ready = time.perf_counter()
+
+    def _swap_sinks(self):
+        with self.reconfig_lock:
+            factory, self.pending_sinks = self.pending_sinks, None
+        for sink in self.sinks:
+            sink.close()
+        try:
+            self.sinks = list(factory())
+        except Exception as e:
+            self.sinks = []
+            self._error(f"Could not reopen the output: {e}")
+
+    def _reconfigured(self, frame, now):
+        # True once a frame that went through the new configuration has been sent
+        with self.reconfig_lock:
+            if (self.reconfig_started is None or self.pending_source is not None
+                    or self.pending_sinks is not None or frame.timestamp < self.reconfig_ready):
+                return False
+            self.stats.record("reconfigure", now - self.reconfig_started)
+            self.reconfig_started = None
+            return True
+
+    def _dropped(self, counter):
+        def on_drop(frame):
+            self.stats.count(counter)
+            frame.release()
+        return on_drop
+
+    def _capture_loop(self):
+        shape = None
+        while self.running:
+            if self.pending_source is not None:
+                self._swap_source()
+                shape = None # new mode, probably a new frame size
+            buffer = self.pool.acquire(shape) if shape else None
+            start = time.perf_counter()
+            retval, frame = self.source.read(buffer.array if buffer else None)
+            self.stats.record("capture", time.perf_counter() - start)
+            if not retval:
+                if buffer:
+                    buffer.release()
+                time.sleep(0.005) # camera hiccup. dont spin the cpu at 100%
+                continue
+            if buffer is None or frame is not buffer.array:
+                # first frame, or the capture size changed and cv2 allocated a new array. take that one into the pool
+                if buffer:
+                    buffer.release()
+                buffer = self.pool.adopt(frame)
+                shape = frame.shape
+            buffer.timestamp = time.perf_counter()
+            self.capture_queue.put(buffer)
+
+    def _process_loop(self):
+        while self.running:
+            frame = self.capture_queue.get(timeout=0.1)
+            if frame is None:
+                continue
+            output = self.processor.process(frame)
+            frame.release()
+            self.output_queue.put(output)
+
+    def _output_loop(self):
+        frame = None
+        next_time = time.perf_counter()
+        while self.running:
+            now = time.perf_counter()
+            if now < next_time:
+                time.sleep(next_time - now)
+            if self.pending_sinks is not None:
+                self._swap_sinks()
+
+            # take the newest processed frame. if nothing new showed up, frame stays the last one
+            fresh = False
+            while (newest := self.output_queue.get(timeout=0)) is not None:
+                if frame is not None:
+                    frame.release()
+                frame = newest
+                fresh = True
+
+            if frame is not None:
+                if not fresh:
+                    self.stats.count("output repeated")
+                start = time.perf_counter()
+                for sink in self.sinks + self.attached:
+                    sink.send(frame.array)
+                end = time.perf_counter()
+                self.stats.record("send", end - start)
+                if fresh:
+                    self.stats.record("latency", end - frame.timestamp) # capture -> sent, only counted once per frame
+                    if self.reconfig_started is not None:
+                        self._reconfigured(frame, end)
+                if self.on_preview is not None:
+                    self.on_preview(frame)
+
+            next_time += 1.0 / self.fps
+            if next_time < time.perf_counter() - 1.0 / self.fps:
+                next_time = time.perf_counter() # we fell way behind. dont try to catch up with a burst
+
+        if frame is not None:
+            frame.release()
+
+
+class _ClosedSource:
+    # stands in when a reconfigure couldn't open the new source, so the capture thread just idles
+    pixel_format = "BGR"
+
+    def read(self, out=None):
+        return False, None
+
+    def release(self):
+        pass
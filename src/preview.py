@@ -0,0 +1,68 @@
+import threading
+import time
+import cv2
+
+from buffer_pool import PooledFrame
+from pipeline import LatestQueue
+from stats import StageStats
+
+
+class PreviewRenderer:
+    # Makes the labelVideoPreview images on its own thread, at its own rate.
+    # The output thread calls offer() for every frame it sends. offer() only does a time check and
+    # a queue put, so the virtual cam never waits on the preview. Frames over the preview rate, or
+    # while the preview can't be seen (visible = False), are thrown away right there. The render thread
+    # shrinks the frame to target_size and hands the small copy to on_frame.
+    def __init__(self, on_frame, fps=15, stats=None):
+        self.on_frame = on_frame
+        self.stats = stats if stats is not None else StageStats(enabled=False)
+        self.fps = fps                  # preview rate, independent of the output fps. 0 turns the preview off
+        self.visible = True             # set from the GUI thread when the tab/window is hidden or minimized
+        self.target_size = (720, 480)   # label size, also set from the GUI thread
+        self.queue = LatestQueue(maxsize=1, on_drop=PooledFrame.release)
+        self.last_offer = 0.0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.queue = LatestQueue(maxsize=1, on_drop=PooledFrame.release)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="cammy-preview", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.queue.close()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def offer(self, frame):
+        # called from the output thread with a PooledFrame. keep this cheap
+        if not self.visible or not self.fps:
+            return
+        now = time.perf_counter()
+        if now - self.last_offer < 1.0 / self.fps:
+            return
+        self.last_offer = now
+        self.queue.put(frame.retain())
+
+    def _run(self):
+        while self.running:
+            frame = self.queue.get(timeout=0.1)
+            if frame is None:
+                continue
+            start = time.perf_counter()
+            image = self._fit(frame.array)
+            frame.release()
+            self.stats.record("preview", time.perf_counter() - start)
+            self.on_frame(image)
+
+    def _fit(self, frame):
+        # shrink to fit target_size keeping the aspect ratio, so the GUI doesn't have to scale anything
+        h, w = frame.shape[:2]
+        target_w, target_h = self.target_size
+        scale = min(target_w / w, target_h / h)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        return cv2.resize(frame, size, interpolation=interpolation)
@@ -16,6 +16,11 @@ class MainWindow(QMainWindow):
         self.tab_cammy = TabCammy(self)
         self.tab_about = TabAbout(self)
 
+    def closeEvent(self, event):
+        # camera, recording and shared output get stopped before Qt tears the tabs down
+        self.tab_cammy.shutdown()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,146 @@
+import time
+
+# Keeps the Cammy pipeline inside its frame budget (1000/fps ms) by turning quality knobs down when
+# it can't keep up, and back up when there's room again.
+#
+# Overloaded means, over the last second: the transform p95 is above 80% of the budget, the process
+# thread dropped more than 10% of the captured frames, or capture-to-send latency p95 is over three
+# frames. Headroom means transform p95 under 50% of the budget, no drops and latency under two frames.
+# Those gaps plus needing 2 bad seconds to step down but `headroom_ticks` good ones to step up are the
+# hysteresis. If a step up gets undone within 10 s, the next step up has to wait twice as long.
+#
+# The ladder goes from cheapest to most visible: preview rate first, then how often the detector
+# runs, then the detector's input size. Output resolution isn't on it, the virtual cam's size is fixed
+# once the device is open, and a smaller frame scaled back up by the sink would cost more, not less.
+
+LADDER = [
+    ("preview_fps", 10),
+    ("detection_interval", 2),
+    ("preview_fps", 5),
+    ("detection_interval", 3),
+    ("infer_size", 256),
+    ("detection_interval", 5),
+    ("infer_size", 192),
+]
+
+DESCRIPTIONS = {
+    "preview_fps": lambda v: f"preview at {v} fps",
+    "detection_interval": lambda v: f"detection every {v} frames" if v > 1 else "detection every frame",
+    "infer_size": lambda v: f"detector input {v}px",
+}
+
+
+class QualityController:
+    # Plain class, update() gets called once a second from TabCammy's stats timer (GUI thread). It only
+    # sets attributes the pipeline threads read, same as the settings handlers do.
+    def __init__(self, processor, preview, stats, log=print, fps=30, headroom_ticks=5):
+        self.processor = processor
+        self.preview = preview
+        self.stats = stats
+        self.log = log
+        self.fps = fps
+        self.base_headroom_ticks = headroom_ticks
+        self.enabled = False
+        self.reset()
+
+    def reset(self, fps=None):
+        # call when the pipeline (re)starts. whatever the knobs are set to now counts as full quality
+        if fps:
+            self.fps = fps
+        self.level = 0
+        self.base = {
+            "preview_fps": self.preview.fps,
+            "detection_interval": self.processor.detection_interval,
+            "infer_size": self.processor.detector.infer_size,
+        }
+        self.overloaded_ticks = 0
+        self.headroom_ticks = 0
+        self.needed_headroom = self.base_headroom_ticks
+        self.last_step_up = 0.0
+        self.last_drops = self.stats.counter("capture dropped")
+        self.last_frames = self.stats.total("capture")
+
+    def restore(self):
+        # back to full quality, e.g. when the controller gets switched off
+        if self.level:
+            self._apply(0)
+            self.log("Quality: back to full quality")
+
+    def settings(self, level):
+        values = dict(self.base)
+        for knob, value in LADDER[:level]:
+            if knob == "preview_fps":
+                values[knob] = min(values[knob], value) if values[knob] else 0 # preview off stays off
+            elif knob == "detection_interval":
+                values[knob] = max(values[knob], value)
+            elif self.processor.detector.size_adjustable():
+                values[knob] = min(values[knob], value) if values[knob] else value
+        return values
+
+    def _apply(self, level):
+        self.level = level
+        values = self.settings(level)
+        self.preview.fps = values["preview_fps"]
+        self.processor.detection_interval = values["detection_interval"]
+        self.processor.detector.infer_size = values["infer_size"]
+
+    def update(self):
+        if not self.enabled or not self.fps:
+            return
+        budget = 1000.0 / self.fps
+        window = max(int(self.fps), 1)
+        transform = self.stats.percentile("transform", 95, last=window) or 0.0
+        latency = self.stats.percentile("latency", 95, last=window) or 0.0
+
+        drops = self.stats.counter("capture dropped")
+        frames = self.stats.total("capture")
+        dropped = drops - self.last_drops
+        captured = max(frames - self.last_frames, 1)
+        self.last_drops, self.last_frames = drops, frames
+
+        if transform > 0.8 * budget:
+            reason = f"transform p95 {transform:.1f} ms, budget {budget:.1f} ms"
+        elif dropped > 0.1 * captured:
+            reason = f"{dropped} of {captured} frames dropped"
+        elif latency > 3 * budget:
+            reason = f"latency p95 {latency:.1f} ms"
+        else:
+            reason = None
+
+        if reason:
+            self.headroom_ticks = 0
+            self.overloaded_ticks += 1
+            if self.overloaded_ticks >= 2 and self.level < len(LADDER):
+                if time.monotonic() - self.last_step_up < 10:
+                    # the last step up didn't hold, be slower to try again
+                    self.needed_headroom = min(self.needed_headroom * 2, 120)
+                self._step(+1, f"Quality down ({reason})")
+            return
+
+        self.overloaded_ticks = 0
+        if transform < 0.5 * budget and dropped == 0 and latency < 2 * budget:
+            self.headroom_ticks += 1
+            if self.headroom_ticks >= self.needed_headroom and self.level > 0:
+                self.last_step_up = time.monotonic()
+                self._step(-1, f"Quality up (transform p95 {transform:.1f} ms, budget {budget:.1f} ms)")
+        else:
+            self.headroom_ticks = 0
+
+    def _step(self, direction, message):
+        # moves to the next level in `direction` that actually changes something (steps can be no-ops,
+        # e.g. infer_size with an exported model, or preview_fps when the preview is off)
+        old = self.settings(self.level)
+        level = self.level
+        while 0 <= level + direction <= len(LADDER):
+            level += direction
+            new = self.settings(level)
+            if new != old:
+                break
+        self.overloaded_ticks = 0
+        self.headroom_ticks = 0
+        if new == old:
+            self.level = level
+            return
+        self._apply(level)
+        changes = [DESCRIPTIONS[knob](value) for knob, value in new.items() if old[knob] != value]
+        self.log(f"{message}: {', '.join(changes)}")
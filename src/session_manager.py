@@ -0,0 +1,344 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6 import QtCore
+
+from adb_client import AdbClient, AdbError
+from telemetry import TelemetrySession, TelemetryTimeout
+
+# Several phones at once (multi-angle rigs). A DeviceSession is one device: its telemetry and, when
+# streaming, its own scrcpy process. The SessionManager drives all of them from one QTimer tick:
+#
+#   - telemetry polls are handed to one shared ThreadPoolExecutor, at most one in flight per device.
+#     a device that stops answering is polled less and less often, and only reported when it
+#     starts or stops failing
+#   - scrcpy runs as a QProcess per device, so output and exits come in through the Qt event loop
+#   - a scrcpy that exits on its own is restarted with backoff (RestartPolicy), and given up on if
+#     it keeps dying
+#   - every stream has a bitrate cap and a CPU budget for its scrcpy process. going over the CPU budget
+#     for a few ticks in a row (or the phone getting hot) restarts the stream at a lower max fps
+#
+# No timer or thread per device, so 8 phones cost about the same bookkeeping as 1.
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+HOT = ("severe", "critical", "emergency", "shutdown")
+
+
+class RestartPolicy:
+    # exponential backoff, and give up after max_restarts crashes within `window` seconds
+    def __init__(self, max_restarts=5, window=60.0, backoff=1.0, max_backoff=30.0):
+        self.max_restarts = max_restarts
+        self.window = window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.crashes = []
+
+    def next_delay(self, now):
+        # seconds to wait before restarting, None = stop trying
+        self.crashes = [t for t in self.crashes if now - t < self.window]
+        self.crashes.append(now)
+        if len(self.crashes) > self.max_restarts:
+            return None
+        return min(self.max_backoff, self.backoff * 2 ** (len(self.crashes) - 1))
+
+    def reset(self):
+        self.crashes = []
+
+
+def parse_bitrate(text):
+    # scrcpy style "8M", "2000K", "500000" -> bits per second
+    text = str(text).strip().upper()
+    if not text:
+        return None
+    scale = {"K": 1000, "M": 1000000}.get(text[-1], 1)
+    try:
+        return int(float(text[:-1] if scale != 1 else text) * scale)
+    except ValueError:
+        return None
+
+
+def parse_fps(text):
+    # "30" -> 30, None for anything that isn't a positive whole number
+    try:
+        fps = int(str(text).strip())
+    except ValueError:
+        return None
+    return fps if fps > 0 else None
+
+
+def process_cpu_time(pid):
+    # user + system cpu seconds of a process, None if it can't be read (not linux, already gone)
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class DeviceSession:
+    def __init__(self, serial, client, bitrate_budget, cpu_budget, min_fps, policy=None, telemetry_timeout=3.0):
+        self.serial = serial
+        self.telemetry = TelemetrySession(serial, client, telemetry_timeout)
+        self.last_telemetry = {}
+        self.telemetry_future = None
+        self.next_poll = 0.0
+        self.telemetry_error = None # what the current run of failed polls was reported with
+        self.telemetry_failures = 0 # failed polls in a row
+
+        self.process = None
+        self.state = "idle" # idle / running / backoff / failed
+        self.stopping = False
+        self.restart_at = None
+        self.policy = policy or RestartPolicy()
+        self.partial = {"out": b"", "err": b""}
+
+        self.bitrate = None # what was asked for, capped by bitrate_budget when starting
+        self.max_fps = None
+        self.extra_args = []
+        self.bitrate_budget = bitrate_budget
+        self.cpu_budget = cpu_budget # percent of one core for the scrcpy client
+        self.min_fps = min_fps
+        self.cpu = None              # last measured cpu %
+        self.cpu_sample = None       # (wall time, cpu time)
+        self.over_budget = 0         # ticks in a row over the cpu budget
+        self.throttled_at = 0.0      # last time the fps was lowered
+
+    def arguments(self):
+        args = ["-s", self.serial, "--window-title", self.serial]
+        bitrate = min(filter(None, (self.bitrate, self.bitrate_budget)), default=None)
+        if bitrate:
+            args += ["-b", str(bitrate)]
+        if self.max_fps:
+            args += ["--max-fps", str(self.max_fps)]
+        return args + self.extra_args
+
+
+class SessionManager(QtCore.QObject):
+    sessionOutput = QtCore.pyqtSignal(str, str, bool)    # serial, line, from stderr
+    sessionState = QtCore.pyqtSignal(str, str)           # serial, idle/running/backoff/failed
+    sessionMessage = QtCore.pyqtSignal(str, str)         # serial, something worth logging
+    telemetryUpdated = QtCore.pyqtSignal(str, object)    # serial, TelemetrySession.poll_once() dict
+    _telemetryDone = QtCore.pyqtSignal(str, object, str) # from the pool: serial, result, error
+
+    def __init__(self, parent=None, client=None, scrcpy="scrcpy", tick_interval=1000, telemetry_interval=2.0,
+                 max_workers=4, bitrate_budget=8000000, cpu_budget=60.0, min_fps=15, restart_backoff=1.0,
+                 max_restarts=5, telemetry_timeout=3.0, max_telemetry_interval=30.0):
+        super().__init__(parent)
+        self.client = client or AdbClient()
+        self.scrcpy = scrcpy
+        self.telemetry_interval = telemetry_interval
+        self.max_telemetry_interval = max_telemetry_interval
+        self.telemetry_timeout = telemetry_timeout
+        self.restart_backoff = restart_backoff
+        self.max_restarts = max_restarts
+        self.bitrate_budget = bitrate_budget
+        self.cpu_budget = cpu_budget
+        self.min_fps = min_fps
+        self.sessions = {}
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="device-session")
+        self._telemetryDone.connect(self._on_telemetry)
+
+        self.tickTimer = QtCore.QTimer(self)
+        self.tickTimer.setInterval(tick_interval)
+        self.tickTimer.timeout.connect(self._tick)
+        self.tickTimer.start()
+
+    def add(self, serial):
+        if serial not in self.sessions:
+            policy = RestartPolicy(self.max_restarts, backoff=self.restart_backoff)
+            self.sessions[serial] = DeviceSession(serial, self.client, self.bitrate_budget, self.cpu_budget, self.min_fps,
+                                                  policy, self.telemetry_timeout)
+        return self.sessions[serial]
+
+    def remove(self, serial):
+        session = self.sessions.pop(serial, None)
+        if session is None:
+            return
+        self._kill(session)
+        self.pool.submit(session.telemetry.close)
+
+    def start_stream(self, serial, bitrate=None, max_fps=None, extra_args=()):
+        # bitrate/max_fps are what the user typed. returns False, and says why through sessionMessage,
+        # if they don't make sense
+        session = self.add(serial)
+        if session.process is not None:
+            return True
+        parsed_bitrate = parse_bitrate(bitrate) if bitrate else None
+        if bitrate and not parsed_bitrate:
+            self.sessionMessage.emit(serial, f"bitrate {bitrate!r} isn't valid, use something like 8M or 2000K")
+            return False
+        parsed_fps = parse_fps(max_fps) if max_fps else None
+        if max_fps and parsed_fps is None:
+            self.sessionMessage.emit(serial, f"max fps {max_fps!r} isn't valid, it has to be a whole number")
+            return False
+        if parsed_bitrate and session.bitrate_budget and parsed_bitrate > session.bitrate_budget:
+            self.sessionMessage.emit(serial, f"bitrate {bitrate} is over the per device budget, capped to {session.bitrate_budget // 1000}K")
+        session.bitrate = parsed_bitrate
+        session.max_fps = parsed_fps
+        session.extra_args = list(extra_args)
+        session.policy.reset()
+        self._launch(session)
+        return True
+
+    def stop_stream(self, serial):
+        session = self.sessions.get(serial)
+        if session:
+            self._kill(session)
+            self._set_state(session, "idle")
+
+    def streaming(self):
+        return [serial for serial, session in self.sessions.items() if session.process is not None]
+
+    def shutdown(self):
+        self.tickTimer.stop()
+        for serial in list(self.sessions):
+            self.remove(serial)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _set_state(self, session, state):
+        if session.state != state:
+            session.state = state
+            self.sessionState.emit(session.serial, state)
+
+    def _launch(self, session):
+        process = QtCore.QProcess(self)
+        process.setProgram(self.scrcpy)
+        process.setArguments(session.arguments())
+        process.readyReadStandardOutput.connect(lambda: self._read(session, "out"))
+        process.readyReadStandardError.connect(lambda: self._read(session, "err"))
+        process.finished.connect(lambda code, status: self._on_finished(session, process, code, status))
+        process.errorOccurred.connect(lambda error: self._on_error(session, process, error))
+        session.process = process
+        session.stopping = False
+        session.restart_at = None
+        session.cpu_sample = None
+        session.over_budget = 0
+        process.start()
+        self.sessionMessage.emit(session.serial, f"scrcpy started: scrcpy {' '.join(session.arguments())}")
+        self._set_state(session, "running")
+
+    def _kill(self, session):
+        session.restart_at = None
+        process, session.process = session.process, None
+        if process is None:
+            return
+        session.stopping = True
+        process.terminate()
+        if not process.waitForFinished(1000):
+            process.kill()
+            process.waitForFinished(1000)
+        process.deleteLater()
+
+    def _read(self, session, stream):
+        process = session.process
+        if process is None:
+            return
+        data = (process.readAllStandardOutput() if stream == "out" else process.readAllStandardError()).data()
+        # a read can end mid line, keep the tail for next time
+        *lines, session.partial[stream] = (session.partial[stream] + data).split(b"\n")
+        for line in lines:
+            self.sessionOutput.emit(session.serial, line.decode(errors="replace").rstrip(), stream == "err")
+
+    def _on_finished(self, session, process, code, status):
+        if session.stopping or process is not session.process:
+            return # we stopped it
+        session.process = None
+        process.deleteLater()
+        if status == QtCore.QProcess.ExitStatus.NormalExit and code == 0:
+            # the user closed the scrcpy window, that's not a crash
+            self._set_state(session, "idle")
+            return
+        delay = session.policy.next_delay(time.monotonic())
+        if delay is None:
+            self.sessionMessage.emit(session.serial, "scrcpy keeps exiting, giving up")
+            self._set_state(session, "failed")
+            return
+        self.sessionMessage.emit(session.serial, f"scrcpy exited with code {code}, restarting in {delay:.0f}s")
+        session.restart_at = time.monotonic() + delay
+        self._set_state(session, "backoff")
+
+    def _on_error(self, session, process, error):
+        # a process that never started doesn't emit finished, and retrying won't help
+        if error != QtCore.QProcess.ProcessError.FailedToStart or process is not session.process:
+            return
+        session.process = None
+        process.deleteLater()
+        self.sessionMessage.emit(session.serial, f"could not start {self.scrcpy}: {process.errorString()}")
+        self._set_state(session, "failed")
+
+    def _tick(self):
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if session.restart_at is not None and now >= session.restart_at and session.serial in self.sessions:
+                self._launch(session)
+            if session.process is not None:
+                self._check_budget(session, now)
+            if session.telemetry_future is None and now >= session.next_poll:
+                session.next_poll = now + self.telemetry_interval
+                session.telemetry_future = self.pool.submit(self._poll, session)
+
+    def _poll(self, session):
+        # pool thread. results go back to the GUI thread through a queued signal
+        try:
+            self._telemetryDone.emit(session.serial, session.telemetry.poll_once(), "")
+        except TelemetryTimeout as e:
+            self._telemetryDone.emit(session.serial, None, str(e))
+        except (OSError, AdbError) as e:
+            self._telemetryDone.emit(session.serial, None, f"telemetry session lost: {e}")
+        except Exception as e:
+            # anything else (output we couldn't parse...) still has to come back, or telemetry_future
+            # never clears and this device isn't polled again
+            self._telemetryDone.emit(session.serial, None, f"telemetry poll failed: {e!r}")
+
+    def _on_telemetry(self, serial, telemetry, error):
+        session = self.sessions.get(serial)
+        if session is None:
+            return
+        session.telemetry_future = None
+        if error:
+            # offline, unauthorized or unplugged: say so once, then poll it less often until it answers
+            if session.telemetry_error is None:
+                self.sessionMessage.emit(serial, error)
+                session.telemetry_error = error
+            session.telemetry_failures += 1
+            backoff = self.telemetry_interval * 2 ** session.telemetry_failures
+            session.next_poll = time.monotonic() + min(backoff, self.max_telemetry_interval)
+            return
+        if session.telemetry_error is not None:
+            self.sessionMessage.emit(serial, "telemetry is back")
+            session.telemetry_error = None
+            session.telemetry_failures = 0
+        session.last_telemetry = telemetry
+        self.telemetryUpdated.emit(serial, telemetry)
+
+    def _check_budget(self, session, now):
+        cpu_time = process_cpu_time(session.process.processId())
+        if cpu_time is None:
+            return
+        if session.cpu_sample is not None:
+            wall, previous = session.cpu_sample
+            session.cpu = (cpu_time - previous) / max(now - wall, 1e-3) * 100
+        session.cpu_sample = (now, cpu_time)
+
+        hot = session.last_telemetry.get("thermal") in HOT
+        if session.cpu is not None and session.cpu > session.cpu_budget:
+            session.over_budget += 1
+        else:
+            session.over_budget = 0
+        if session.over_budget < 3 and not hot:
+            return
+        if now - session.throttled_at < 10:
+            return # give the last step a moment to show up in the numbers
+
+        # over budget: same stream at 3/4 the frame rate. a restart, but not a crash
+        current = session.max_fps or 60
+        lower = max(session.min_fps, int(current * 0.75))
+        if lower >= current:
+            return # already as low as it goes
+        reason = "phone is hot" if hot else f"scrcpy at {session.cpu:.0f}% cpu (budget {session.cpu_budget:.0f}%)"
+        self.sessionMessage.emit(session.serial, f"{reason}, dropping to {lower} fps")
+        session.max_fps = lower
+        session.throttled_at = now
+        self._kill(session)
+        self._launch(session)
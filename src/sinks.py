@@ -0,0 +1,250 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import cv2
+import numpy as np
+
+from buffer_pool import FramePool
+
+
+class VirtualCamSink:
+    # Pipeline output that pushes frames into the v4l2loopback device. Read the guide for virtual cam.txt ;)
+    def __init__(self, width, height, fps, pixel_format="BGR"):
+        import pyvirtualcam # imported here so the benchmark can use the other sinks without it installed
+
+        self.width = width
+        self.height = height
+        # Pretty self explanatory. Also there is a bug that the virtual cam is resized to 4:3 ratio. I can't seem to find the problem so do check it out ;)
+        self.camera = pyvirtualcam.Camera(
+            width=width,
+            height=height,
+            fps=int(fps),
+            fmt=pyvirtualcam.PixelFormat[pixel_format] # same format as the pipeline, so send() never converts
+        )
+
+    def send(self, frame):
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height))
+        self.camera.send(frame)
+
+    def close(self):
+        self.camera.close()
+
+
+class FrameBusSink:
+    # Publishes the output on a shared memory FrameBus (frame_bus.py) for other consumers, in this
+    # process or others. Sized for width x height BGR, other sizes get resized like VirtualCamSink does.
+    # close() can come from another thread while send() runs (FramePipeline.detach), the lock keeps
+    # the bus from going away mid publish
+    def __init__(self, width, height, name=None, slots=4):
+        from frame_bus import DEFAULT_NAME, FrameBus
+
+        self.width = width
+        self.height = height
+        self.bus = FrameBus(width * height * 3, name or DEFAULT_NAME, slots)
+        self.lock = threading.Lock()
+
+    def send(self, frame):
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height))
+        with self.lock:
+            if self.bus is not None:
+                self.bus.publish(frame)
+
+    def close(self):
+        with self.lock:
+            if self.bus is not None:
+                self.bus.close()
+                self.bus = None
+
+
+class NullSink:
+    # Takes frames and does nothing with them. For benchmarks
+    def send(self, frame):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    # Writes the output to a video file. The writer is opened on the first frame so it gets the real output size
+    def __init__(self, path, fps, fourcc="mp4v"):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+
+    def send(self, frame):
+        if self.writer is None:
+            h, w = frame.shape[:2]
+            self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (w, h))
+        self.writer.write(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class RecordingSink:
+    # Records the output without putting the encoder in the output thread's way. send() copies the frame
+    # into a pooled buffer and queues it (the pipeline reuses its own buffer right after), an encoder
+    # thread takes it from there: raw frames into an ffmpeg process when ffmpeg is around, else
+    # cv2.VideoWriter on the thread itself (it releases the GIL while encoding).
+    #
+    # The queue holds queue_size frames. When the encoder falls behind and it fills up, policy "drop"
+    # throws the new frame away (counted as "record dropped") and "block" waits up to block_timeout for
+    # room, which holds the output thread up, so only for when every frame matters more than the
+    # virtual cam's timing. "record lag" is how long frames sat between send() and being encoded.
+    #
+    # path can have {time} (when recording started) and {segment} in it. With segment_seconds set the
+    # file is rotated every that many seconds of video, and also when the frame size changes.
+    def __init__(self, path, fps, segment_seconds=0, policy="drop", queue_size=8, encoder="auto",
+                 block_timeout=1.0, stats=None):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"unknown recording policy {policy!r}")
+        self.path = path
+        self.fps = fps
+        self.segment_frames = int(segment_seconds * fps) if segment_seconds else 0
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.encoder = ("ffmpeg" if shutil.which("ffmpeg") else "opencv") if encoder == "auto" else encoder
+        self.stats = stats
+        self.started = time.strftime("%Y%m%d-%H%M%S")
+
+        self.pool = FramePool(max_free=queue_size + 2)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        self.dropped = 0
+        self.lag = 0.0       # seconds, of the last encoded frame
+        self.error = None    # set when the encoder died, frames are thrown away from then on
+        self.segments = []   # files written so far
+        self.writer = None   # the open segment's writer, only touched by the encoder thread (and abort())
+        self.thread = threading.Thread(target=self._encode_loop, name="cammy-recorder")
+        self.thread.start()  # not a daemon, so quitting still lets it finish the file
+
+    def send(self, frame):
+        if self.closed:
+            return
+        buffer = self.pool.acquire(frame.shape, frame.dtype)
+        np.copyto(buffer.array, frame)
+        buffer.timestamp = time.perf_counter()
+        try:
+            if self.policy == "block":
+                self.queue.put(buffer, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(buffer)
+        except queue.Full:
+            buffer.release()
+            self.dropped += 1
+            if self.stats is not None:
+                self.stats.count("record dropped")
+
+    def close(self):
+        # doesn't wait for the encoder (not even for room in the queue), it finishes what's queued and
+        # closes the file on its own. join() to wait
+        self.closed = True
+
+    def join(self, timeout=None):
+        # True once the encoder is done and the file is closed
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def abort(self):
+        # for when join() timed out on quit (ffmpeg hung, disk stalled): the rest of the queue gets
+        # thrown away and ffmpeg killed, so the encoder thread can't keep the process alive
+        self.error = self.error or "recording aborted"
+        writer = self.writer
+        if writer is not None:
+            writer.kill()
+
+    def _encode_loop(self):
+        shape = None
+        written = 0
+        while True:
+            try:
+                buffer = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.closed:
+                    break
+                continue
+            try:
+                if self.error is None:
+                    if self.writer is not None and (buffer.array.shape != shape or (self.segment_frames and written >= self.segment_frames)):
+                        self.writer.close()
+                        self.writer = None
+                    if self.writer is None:
+                        shape = buffer.array.shape
+                        self.writer = self._open(shape)
+                        written = 0
+                    start = time.perf_counter()
+                    self.writer.write(buffer.array)
+                    written += 1
+                    end = time.perf_counter()
+                    self.lag = end - buffer.timestamp
+                    if self.stats is not None:
+                        self.stats.record("encode", end - start)
+                        self.stats.record("record lag", self.lag)
+            except (OSError, ValueError, cv2.error) as e:
+                self.error = self.error or str(e) # keep draining the queue so send() and close() never get stuck
+            finally:
+                buffer.release()
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except OSError as e:
+                self.error = self.error or str(e)
+            self.writer = None
+
+    def _open(self, shape):
+        path = os.path.expanduser(self.path.format(time=self.started, segment=len(self.segments)))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        writer = (_FfmpegWriter if self.encoder == "ffmpeg" else _OpenCvWriter)(path, shape, self.fps)
+        self.segments.append(path)
+        return writer
+
+
+class _FfmpegWriter:
+    # raw BGR frames into ffmpeg's stdin, it encodes in its own process
+    def __init__(self, path, shape, fps):
+        height, width = shape[:2]
+        args = [
+            "ffmpeg", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", path,
+        ]
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+
+    def write(self, frame):
+        self.process.stdin.write(frame.data)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        finally:
+            if self.process.wait() != 0:
+                raise OSError(f"ffmpeg exited with {self.process.returncode}")
+
+    def kill(self):
+        self.process.kill()
+
+
+class _OpenCvWriter:
+    def __init__(self, path, shape, fps, fourcc="mp4v"):
+        height, width = shape[:2]
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+        if not self.writer.isOpened():
+            raise OSError(f"could not open {path} for writing")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+    def kill(self):
+        pass # nothing to interrupt, VideoWriter.write() returns on its own
@@ -0,0 +1,369 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+
+class CameraSource:
+    # Frame source for the pipeline. Anything with read(out) -> (retval, frame) and release() works.
+    # out is a buffer to read into when possible (None = allocate); return a different array if it didn't fit.
+    # pixel_format is what read() returns. The whole pipeline runs in it, so the virtual cam and the
+    # preview get opened in the same format and nothing gets converted per frame.
+    pixel_format = "BGR" # what OpenCV captures decode to anyway
+
+    def __init__(self, index=0, resolution=None, fps=None, fourcc=None):
+        self.cap = cv2.VideoCapture(index)
+        if fourcc:
+            # pick the pixel format that can actually do this mode (camera_caps.find_mode), otherwise
+            # OpenCV may settle on a raw format that only manages a few fps at this size
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        if resolution:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH,  resolution[0])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+        if fps:
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+
+    def read(self, out=None):
+        return self.cap.read(out)
+
+    def mode(self):
+        # (width, height, fps) the capture actually opened in
+        return (
+            int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            self.cap.get(cv2.CAP_PROP_FPS),
+        )
+
+    def release(self):
+        self.cap.release()
+
+
+class FileSource(CameraSource):
+    # Recorded clip as a frame source, mostly for benchmarks. Loops back to the start at the end, and
+    # plays at `fps` if given, otherwise as fast as it decodes.
+    def __init__(self, path, fps=None, loop=True):
+        self.cap = cv2.VideoCapture(path)
+        self.loop = loop
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_time = time.perf_counter()
+
+    def read(self, out=None):
+        if self.interval:
+            _wait_until(self.next_time)
+            self.next_time = max(self.next_time + self.interval, time.perf_counter() - self.interval)
+        retval, frame = self.cap.read(out)
+        if not retval and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            retval, frame = self.cap.read(out)
+        return retval, frame
+
+
+class JpegDecoder:
+    # Decodes a stream of JPEGs on a small thread pool and hands them back in capture order.
+    # A reader thread keeps calling grab() (-> one JPEG as bytes/uint8 array, None = nothing right now,
+    # StopIteration = done) and submits each one to the pool; cv2.imdecode lets go of the GIL, so the
+    # workers really run in parallel. At most `depth` frames are in flight, after that the reader waits.
+    # read() returns the oldest pending frame, unless a newer one is already decoded, then the older
+    # ones are skipped. Frames never come out of order, and a slow consumer doesn't build up latency.
+    def __init__(self, grab, workers=None):
+        self.grab = grab
+        self.workers = workers or max(2, min(4, (os.cpu_count() or 2) - 1))
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="jpeg-decode")
+        self.depth = self.workers + 1
+        self.pending = deque() # futures, oldest first
+        self.skipped = 0       # decoded frames thrown away because a newer one was ready
+        self.cond = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._reader, name="jpeg-reader", daemon=True)
+        self.thread.start()
+
+    def _reader(self):
+        while self.running:
+            try:
+                jpeg = self.grab()
+            except StopIteration:
+                break
+            if jpeg is None:
+                time.sleep(0.005)
+                continue
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.pending) < self.depth or not self.running)
+                if not self.running:
+                    break
+                self.pending.append(self.executor.submit(_decode_jpeg, jpeg))
+                self.cond.notify_all()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def read(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending or not self.running, 1.0)
+            if not self.pending:
+                return False, None
+            future = self.pending.popleft()
+            while self.pending and self.pending[0].done():
+                future = self.pending.popleft()
+                self.skipped += 1
+            self.cond.notify_all()
+        frame = future.result()
+        return frame is not None, frame
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=2)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _decode_jpeg(jpeg):
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class MjpegCameraSource(CameraSource):
+    # Camera in MJPEG mode with the decoding done here instead of inside cap.read(). At 1080p60 / 4K30
+    # a UVC camera usually only does MJPEG, and OpenCV decodes that on one core in read(), which can't
+    # keep up. CONVERT_RGB=0 makes read() return the compressed frame, JpegDecoder spreads the
+    # decoding over a few cores. Frames come back as new arrays (imdecode can't write into a buffer),
+    # the pipeline takes them into its pool.
+    def __init__(self, index=0, resolution=None, fps=None, workers=None):
+        super().__init__(index, resolution, fps, "MJPG")
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        self.decoder = JpegDecoder(self._grab, workers)
+
+    def _grab(self):
+        retval, data = self.cap.read()
+        return data if retval else None
+
+    def read(self, out=None):
+        return self.decoder.read()
+
+    def release(self):
+        self.decoder.close()
+        self.cap.release()
+
+
+class MjpegFileSource:
+    # Recorded MJPEG stream (back to back JPEGs, e.g. `ffmpeg -f v4l2 -input_format mjpeg -i /dev/video0
+    # -c copy cam.mjpeg` or `ffmpeg -i clip.mp4 -c:v mjpeg -f mjpeg clip.mjpeg`) through the same parallel
+    # decoding as MjpegCameraSource, so it can be benchmarked without the camera. frames= takes a list
+    # of already encoded JPEGs instead of a file. Loops, and plays at fps if given.
+    pixel_format = "BGR"
+
+    def __init__(self, path=None, fps=None, loop=True, workers=None, frames=None):
+        if frames is None:
+            with open(path, "rb") as f:
+                frames = split_jpegs(f.read())
+        if not frames:
+            raise ValueError(f"no JPEG frames in {path}")
+        self.frames = frames
+        self.loop = loop
+        self.index = 0
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_time = time.perf_counter()
+        self.decoder = JpegDecoder(self._grab, workers)
+
+    def _grab(self):
+        if self.index >= len(self.frames):
+            if not self.loop:
+                raise StopIteration
+            self.index = 0
+        if self.interval:
+            _wait_until(self.next_time)
+            self.next_time = max(self.next_time + self.interval, time.perf_counter() - self.interval)
+        frame = self.frames[self.index]
+        self.index += 1
+        return frame
+
+    def read(self, out=None):
+        return self.decoder.read()
+
+    def release(self):
+        self.decoder.close()
+
+
+def split_jpegs(data):
+    # SOI (FFD8) ... EOI (FFD9) chunks. EOI can't show up inside the compressed data (0xFF is stuffed there)
+    frames = []
+    view = memoryview(data)
+    start = data.find(b"\xff\xd8")
+    while start != -1:
+        end = data.find(b"\xff\xd9", start + 2)
+        if end == -1:
+            break
+        frames.append(view[start:end + 2])
+        start = data.find(b"\xff\xd8", end + 2)
+    return frames
+
+
+class SyntheticSource:
+    # Fake camera for running the pipeline without hardware: a fixed gradient background with a bright
+    # block (the "person") sliding left and right, so detection and cropping have something to follow.
+    # Paced at `fps` like a real camera, fps=0 hands frames out as fast as they're asked for.
+    pixel_format = "BGR"
+
+    def __init__(self, resolution=(1280, 720), fps=30):
+        self.width, self.height = resolution
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_time = time.perf_counter()
+        self.frame_index = 0
+
+        ramp = np.linspace(40, 140, self.width, dtype=np.uint8)
+        self.background = np.repeat(np.repeat(ramp[None, :, None], self.height, axis=0), 3, axis=2)
+
+    def read(self, out=None):
+        if self.interval:
+            _wait_until(self.next_time)
+            self.next_time = max(self.next_time + self.interval, time.perf_counter() - self.interval)
+        if out is None or out.shape != self.background.shape:
+            out = np.empty_like(self.background)
+        np.copyto(out, self.background)
+
+        block_w, block_h = self.width // 5, self.height // 2
+        travel = self.width - block_w
+        x = int((np.sin(self.frame_index / 60.0) * 0.5 + 0.5) * travel)
+        y = self.height // 3
+        cv2.rectangle(out, (x, y), (x + block_w, min(self.height - 1, y + block_h)), (235, 235, 235), -1)
+        self.frame_index += 1
+        return True, out
+
+    def release(self):
+        pass
+
+
+class ScrcpySource:
+    # The phone's screen/camera straight from scrcpy, decoded in here with PyAV instead of going
+    # scrcpy window -> v4l2loopback -> cv2.VideoCapture (one more encode/decode and copy).
+    # scrcpy runs without a window and records to a fifo as mkv; a decoder thread reads that and keeps
+    # only the newest frame. read() waits for a frame it hasn't handed out yet and converts it
+    # straight into the pipeline's buffer.
+    # path= decodes a file instead of starting scrcpy (a raw .h264/.h265 elementary stream or a
+    # recording), paced at fps if given. Handy for testing without a phone.
+    pixel_format = "BGR"
+
+    def __init__(self, serial=None, max_fps=None, bitrate=None, max_size=None, path=None, fps=None, loop=True,
+                 extra_args=(), scrcpy="scrcpy"):
+        import av # only needed for this source
+        self.av = av
+        self.path = path
+        self.interval = 1.0 / fps if fps else 0.0
+        self.loop = loop and path is not None
+        self.process = None
+        self.fifo_dir = None
+
+        if path is None:
+            self.fifo_dir = tempfile.mkdtemp(prefix="openphonecam-")
+            self.path = os.path.join(self.fifo_dir, "video.mkv")
+            os.mkfifo(self.path)
+            args = [scrcpy, "--no-window", "--no-audio", "--no-control", f"--record={self.path}", "--record-format=mkv"]
+            if serial:
+                args += ["-s", serial]
+            if max_fps:
+                args += ["--max-fps", str(int(max_fps))]
+            if bitrate:
+                args += ["-b", str(bitrate)]
+            if max_size:
+                args += ["--max-size", str(int(max_size))]
+            args += list(extra_args)
+            self.process = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        self.condition = threading.Condition()
+        self.frame = None # newest decoded av.VideoFrame
+        self.frame_index = 0
+        self.read_index = 0
+        self.frame_rate = None
+        self.running = True
+        self.thread = threading.Thread(target=self._decode, name="scrcpy-decoder", daemon=True)
+        self.thread.start()
+
+    def _decode(self):
+        # low_delay/nobuffer: hand out every frame as soon as it's decoded, no reordering buffer
+        options = {"fflags": "nobuffer", "flags": "low_delay"}
+        next_time = time.perf_counter()
+        try:
+            while self.running:
+                with self.av.open(self.path, options=options) as container:
+                    stream = container.streams.video[0]
+                    # slice threads split each frame across cores without holding frames back the way
+                    # frame threading does, so it doesn't add latency
+                    stream.thread_type = "SLICE"
+                    if stream.average_rate:
+                        self.frame_rate = float(stream.average_rate)
+                    for frame in container.decode(stream):
+                        if not self.running:
+                            return
+                        if self.interval:
+                            _wait_until(next_time)
+                            next_time = max(next_time + self.interval, time.perf_counter() - self.interval)
+                        with self.condition:
+                            self.frame = frame
+                            self.frame_index += 1
+                            self.condition.notify_all()
+                if not self.loop:
+                    break
+        except (self.av.error.FFmpegError, OSError):
+            pass # scrcpy went away / file is broken. read() starts returning False
+        finally:
+            with self.condition:
+                self.running = False
+                self.condition.notify_all()
+
+    def _next_frame(self, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_index != self.read_index or not self.running, timeout)
+            if self.frame_index == self.read_index:
+                return None
+            self.read_index = self.frame_index
+            return self.frame
+
+    def read(self, out=None):
+        frame = self._next_frame(timeout=1.0)
+        if frame is None:
+            return False, None
+        shape = (frame.height, frame.width, 3)
+        if out is None or out.shape != shape:
+            out = np.empty(shape, dtype=np.uint8)
+        if frame.format.name == "yuv420p" and frame.width % 2 == 0 and frame.height % 2 == 0:
+            # what the phone's encoder gives. planes -> I420 array, then one conversion into the pipeline buffer
+            cv2.cvtColor(frame.to_ndarray(), cv2.COLOR_YUV2BGR_I420, dst=out)
+        else:
+            np.copyto(out, frame.to_ndarray(format="bgr24"))
+        return True, out
+
+    def mode(self):
+        # size isn't known until the first frame shows up
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame is not None or not self.running, 10.0)
+            if self.frame is None:
+                return (0, 0, 0)
+            return (self.frame.width, self.frame.height, self.frame_rate or 0)
+
+    def release(self):
+        self.running = False
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            try:
+                # if scrcpy died before opening the fifo the decoder is still stuck opening it, this lets it through
+                os.close(os.open(self.path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        self.thread.join(timeout=2)
+        if self.fifo_dir:
+            shutil.rmtree(self.fifo_dir, ignore_errors=True)
+
+
+def _wait_until(deadline):
+    delay = deadline - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
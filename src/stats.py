@@ -0,0 +1,102 @@
+import csv
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class StageStats:
+    # Timing for each pipeline stage, kept in a rolling window so the percentiles follow what's
+    # happening now and not the whole session.
+    # Stages call record(stage, seconds) and count(name) from whatever thread they run on. When
+    # enabled is False both return straight away, so leaving the calls in the hot path costs basically nothing.
+    def __init__(self, window=600, enabled=True):
+        self.window = window   # samples kept per stage
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}  # stage -> deque of seconds
+            self.totals = {}   # stage -> samples recorded since reset
+            self.counters = {} # name -> count (dropped frames etc)
+            self.started = time.perf_counter()
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self.totals[stage] = self.totals.get(stage, 0) + 1
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def percentile(self, stage, q, last=None):
+        # ms at percentile q over the newest `last` samples of a stage (all of the window if None)
+        with self.lock:
+            samples = self.samples.get(stage)
+            if not samples:
+                return None
+            values = list(samples)[-last:] if last else list(samples)
+        return float(np.percentile(values, q) * 1000)
+
+    def counter(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+    def total(self, stage):
+        with self.lock:
+            return self.totals.get(stage, 0)
+
+    def summary(self):
+        # {"stages": {stage: {count, mean, p50, p95, p99 in ms}}, "counters": {...}, "uptime": seconds}
+        with self.lock:
+            samples = {stage: np.array(values) for stage, values in self.samples.items() if values}
+            totals = dict(self.totals)
+            counters = dict(self.counters)
+            uptime = time.perf_counter() - self.started
+
+        stages = {}
+        for stage, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            stages[stage] = {
+                "count": totals[stage],
+                "mean": float(values.mean() * 1000),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+            }
+        return {"stages": stages, "counters": counters, "uptime": uptime}
+
+    def format(self, summary=None):
+        summary = summary or self.summary()
+        lines = []
+        for stage, s in summary["stages"].items():
+            lines.append(f"{stage:<10} p50 {s['p50']:6.1f}  p95 {s['p95']:6.1f}  p99 {s['p99']:6.1f} ms  (n={s['count']})")
+        for name, value in summary["counters"].items():
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def export_csv(self, path):
+        summary = self.summary()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stage", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+            for stage, s in summary["stages"].items():
+                writer.writerow([stage, s["count"], f"{s['mean']:.3f}", f"{s['p50']:.3f}", f"{s['p95']:.3f}", f"{s['p99']:.3f}"])
+            for name, value in summary["counters"].items():
+                writer.writerow([name, value, "", "", "", ""])
@@ -1,41 +1,77 @@
 import json
-import cv2
-import numpy as np
-from PyQt6 import QtGui, QtCore
-from PyQt6.QtWidgets import QFileDialog
-from ultralytics import YOLO
+import threading
 import time
-import pyvirtualcam
+from PyQt6 import QtGui, QtCore
+from PyQt6.QtWidgets import QCompleter, QFileDialog
+
+import camera_caps
+
+from backends import create_backend
+from frame_processor import FrameProcessor
+from pipeline import FramePipeline
+from preview import PreviewRenderer
+from quality import QualityController
+from sinks import FrameBusSink, RecordingSink, VirtualCamSink
+from sources import CameraSource, MjpegCameraSource, ScrcpySource
+from stats import StageStats
 
 # Comments specially for my bbg RudyDaBot ;)
 # also read the guide for virtual cam.txt ;)
 
-class TabCammy:
+CAMERA_INDEX = 0
+CAMERA_DEVICE = f"/dev/video{CAMERA_INDEX}"
+MODEL_PATH = "src/model.pt"
+INFER_SIZE = 320 # detector input size, exported models are built for this size
+RECORDING_PATH = "~/Videos/OpenPhoneCam/cammy_{time}_{segment:03d}.mp4"
+RECORDING_SEGMENT = 600 # seconds per file
+RECORDING_CLOSE_TIMEOUT = 10 # seconds quitting waits for the recorder to finish its file
+FRAME_BUS_NAME = "openphonecam" # shared memory name other processes open with frame_bus.FrameBusReader
+
+# QImage format matching the pipeline's pixel format, so the preview can show frames as they are
+PREVIEW_FORMATS = {
+    "BGR": QtGui.QImage.Format.Format_BGR888,
+    "RGB": QtGui.QImage.Format.Format_RGB888,
+}
+
+class TabCammy(QtCore.QObject):
+    previewReady = QtCore.pyqtSignal()
+    modelLoaded = QtCore.pyqtSignal(object, str)
+    modelFailed = QtCore.pyqtSignal(str)
+    capsReady = QtCore.pyqtSignal(object)
+    pipelineError = QtCore.pyqtSignal(str)
+    sourceOpened = QtCore.pyqtSignal(object, object, str) # source, (width, height, fps), error
+
     def __init__(self, ui):
+        super().__init__(ui)
         self.ui = ui
 
-        cap = cv2.VideoCapture(0)
-
-        self.maxFPS = cap.get(cv2.CAP_PROP_FPS)
-        self.maxW = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.maxH = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        cap.release()
-
-        self.cap = None
-        self.fps = self.maxFPS
-        self.resolution = [self.maxW, self.maxH]
-        self.aspectRatio = None
-        self.mirror_xaxis = False
-        self.mirror_yaxis = False
-
-        self.ui.lineEditFPS.setText(f"{int(self.maxFPS)}")
-        self.ui.lineEditResolution.setText(f"{self.maxW}x{self.maxH}")
-
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self._update_frame)
+        # Nothing slow happens in here so the window shows up straight away. The camera isn't opened
+        # until Connect. What modes it supports comes from camera_caps (cached, rescanned on hotplug)
+        # and fills the resolution/fps suggestions; without that we use whatever mode it comes up in.
+        # The model (ultralytics + torch + weights, or an exported ONNX/OpenVINO copy, see backends.py)
+        # loads on a background thread the first time the Cammy tab is opened or Connect is pressed, see _ensure_model.
+        self.pipeline = None
+        self.fps = None
+        self.resolution = None
+        self.camera_caps = None # camera_caps.probe_device() result for CAMERA_DEVICE, None until scanned / on non-linux
+        self.mode_from_caps = False # resolution/fps are the webcam's best mode, not something the user typed
+        self.opening_source = False # the source is being opened on a background thread, see _open_source
+        self.closing = False        # the window is closing, see shutdown()
+        self.sourceOpened.connect(self._on_source_opened)
+
+        self.capsReady.connect(self._on_caps_ready)
+        self._scan_cameras()
+        # /dev changes when a camera is plugged in or out. rescan then (cache makes it cheap)
+        self.deviceWatcher = QtCore.QFileSystemWatcher(["/dev"], self)
+        self.rescanTimer = QtCore.QTimer(self)
+        self.rescanTimer.setSingleShot(True)
+        self.rescanTimer.setInterval(500) # udev creates the nodes in a burst, wait it out
+        self.rescanTimer.timeout.connect(self._scan_cameras)
+        self.deviceWatcher.directoryChanged.connect(self.rescanTimer.start)
 
         self.ui.btnConnect.clicked.connect(self._start_camera)
         self.ui.btnDisconnect.clicked.connect(self._stop_camera)
+        self.ui.btnExportStats.clicked.connect(self.export_stats)
 
         self.ui.lineEditFPS.editingFinished.connect(self._update_fps)
         self.ui.lineEditResolution.editingFinished.connect(self._update_resolution)
@@ -44,166 +80,519 @@ class TabCammy:
         self.ui.checkBoxMirror_xaxis.stateChanged.connect(self._update_mirror_x)
         self.ui.checkBoxMirror_yaxis.stateChanged.connect(self._update_mirror_y)
 
-        self.model = YOLO("src/model.pt") # initialize model. u should understand this i believe so
-        self.detection_interval = 1 # My laptop lags when each and every frame updates. Every nth frame will be processed by the CNN model update where n will be the value of this
-        self.frame_count = 0        # counts frames.
-        self.last_cx = None         # saves previous center position - x
-        self.last_cy = None         # saves previous center position - y
-        
-        self.virtual_cam = None     # Virtual cam obj
+        self.model = None              # inference backend, set once the background load finishes
+        self.model_loading = False
+        self.start_when_loaded = False # Connect was pressed while the model was still loading
+        self.inference_backend = "auto" # "ultralytics", "onnx", "openvino" or "auto" (onnx when onnxruntime is installed)
+        self.inference_int8 = False     # INT8 quantized export, a bit less accurate but faster on CPU
+        self.inference_threads = None   # cpu threads for inference, None = backend default
+        self.processor = FrameProcessor(None, INFER_SIZE) # detection + crop + ratio + mirror. runs on the pipeline thread
+        self.modelLoaded.connect(self._on_model_loaded)
+        self.modelFailed.connect(self._on_model_failed)
+
         self.virtual_cam_enabled = True # Variable to enable virtual cam or disable it.
 
+        self.stats = StageStats() # per stage timings, shown under the preview. StageStats(enabled=False) turns it off
+        self.stats_sent = 0       # frames sent at the last stats refresh, for the fps readout
+        self.reconfigs_seen = 0   # "reconfigure" samples already reported in textEditStatus
+        self.pipelineError.connect(self.ui.textEditStatus.append)
+        self.statsTimer = QtCore.QTimer(self)
+        self.statsTimer.setInterval(1000)
+        self.statsTimer.timeout.connect(self._show_stats)
+
+        # the preview renderer shrinks frames to label size on its own thread at preview_fps, and hands
+        # them over through previewReady. only the newest one is kept, so if the GUI is busy (window
+        # being dragged etc) it just skips frames instead of queueing them up
+        self.preview = PreviewRenderer(self._on_preview_frame, fps=15, stats=self.stats)
+        self.preview_lock = threading.Lock()
+        self.preview_frame = None
+        self.preview_pending = False
+        self.previewReady.connect(self._show_preview)
+
+        # Low Latency Mode: turn detection/preview quality down when frames take longer than 1000/fps ms
+        # and back up when there's room, see quality.py. runs off the stats timer
+        self.quality = QualityController(self.processor, self.preview, self.stats, log=self.ui.textEditStatus.append)
+        self.ui.checkBoxLowLatency.stateChanged.connect(self._update_low_latency)
+
+        # Record Output: the framed output goes to a file too, encoded on its own thread (RecordingSink).
+        # it's attached to the pipeline next to the virtual cam, so it can start and stop while running
+        self.recorder = None
+        self.ui.checkBoxRecord.stateChanged.connect(self._update_recording)
+
+        # Share Output: the output is also published in shared memory (frame_bus.py) for other programs,
+        # attached the same way as the recorder
+        self.frame_bus = None
+        self.ui.checkBoxFrameBus.stateChanged.connect(self._update_frame_bus)
+
+        # no point rendering a preview nobody can see. track tab switches, minimize/hide and label resizes
+        self.ui.tabWidget.currentChanged.connect(self._update_preview_visibility)
+        self.ui.installEventFilter(self)
+        self.ui.labelVideoPreview.installEventFilter(self)
+
+    def _scan_cameras(self):
+        threading.Thread(target=lambda: self.capsReady.emit(camera_caps.discover()), name="cammy-caps", daemon=True).start()
+
+    def _on_caps_ready(self, devices):
+        self.camera_caps = devices.get(CAMERA_DEVICE)
+        if not self.camera_caps:
+            return
+
+        self.ui.lineEditResolution.setCompleter(QCompleter(camera_caps.resolutions(self.camera_caps), self.ui.lineEditResolution))
+        if self.resolution is None and self.fps is None and not self.ui.checkBoxUSB.isChecked():
+            best = camera_caps.best_mode(self.camera_caps)
+            if best:
+                width, height, fps = best
+                self.resolution = [width, height]
+                self.fps = int(fps) or 30
+                self.mode_from_caps = True
+                self.ui.lineEditResolution.setText(f"{width}x{height}")
+                self.ui.lineEditFPS.setText(f"{self.fps}")
+        self._update_fps_completer()
+
+    def _update_fps_completer(self):
+        if not self.camera_caps or not self.resolution or self.ui.checkBoxUSB.isChecked():
+            return
+        rates = camera_caps.frame_rates(self.camera_caps, *self.resolution)
+        self.ui.lineEditFPS.setCompleter(QCompleter([f"{int(rate)}" for rate in rates], self.ui.lineEditFPS))
+
+    def _supported(self, resolution, fps):
+        # True if the camera can do it, or we just don't know what it can do. the webcam's modes say
+        # nothing about the phone, scrcpy scales to whatever it's asked for
+        if not self.camera_caps or not resolution or self.ui.checkBoxUSB.isChecked():
+            return True
+        return camera_caps.find_mode(self.camera_caps, resolution[0], resolution[1], fps) is not None
+
+    def _ensure_model(self):
+        if self.model is not None or self.model_loading:
+            return
+        self.model_loading = True
+        self.ui.labelPreviewStatus.setText("Loading model...")
+        threading.Thread(target=self._load_model, name="cammy-model-loader", daemon=True).start()
+
+    def _load_model(self):
+        # background thread. importing ultralytics pulls in torch, that's most of the wait.
+        # the first launch with an exported backend also exports the model here, later ones use the cache
+        note = ""
+        try:
+            model = create_backend(self.inference_backend, MODEL_PATH, INFER_SIZE, self.inference_int8, self.inference_threads)
+        except Exception as e:
+            if self.inference_backend == "ultralytics":
+                self.modelFailed.emit(str(e))
+                return
+            # exported backend didn't work out (missing package, export failed...). eager still works
+            note = f"{self.inference_backend} backend unavailable ({e}), falling back to ultralytics"
+            try:
+                model = create_backend("ultralytics", MODEL_PATH, INFER_SIZE, threads=self.inference_threads)
+            except Exception as e:
+                self.modelFailed.emit(str(e))
+                return
+        self.modelLoaded.emit(model, note)
+
+    def _on_model_loaded(self, model, note):
+        if note:
+            self.ui.textEditStatus.append(note)
+        self.model = model
+        self.processor.detector.backend = model
+        self.model_loading = False
+        self.ui.textEditStatus.append(f"Model loaded ({type(model).__name__})")
+        if not self.pipeline:
+            self.ui.labelPreviewStatus.setText("No video signal")
+        if self.start_when_loaded:
+            self.start_when_loaded = False
+            self._start_camera()
+
+    def _on_model_failed(self, error):
+        self.model_loading = False
+        self.start_when_loaded = False
+        self.ui.labelPreviewStatus.setText("Model failed to load")
+        self.ui.textEditStatus.append(f"Model failed to load: {error}")
+        self.ui.btnConnect.setEnabled(True)
+
     def _start_camera(self):
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH,  self.resolution[0])
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
-        self.timer.start(int(1000 / self.fps))
+        if self.model is None:
+            # come back here once the model is in
+            self.start_when_loaded = True
+            self.ui.btnConnect.setEnabled(False)
+            self.ui.textEditStatus.append("Waiting for the model to load, camera starts after")
+            self._ensure_model()
+            return
+
+        if self.opening_source:
+            return
+        factory = self._source_factory()
+        if factory is None:
+            return
+        # opening a camera can take a moment, and scrcpy's size is only known once its first frame is
+        # decoded (up to 10 s). neither happens on the GUI thread, _on_source_opened carries on
+        self.opening_source = True
+        self.ui.btnConnect.setEnabled(False)
+        self.ui.labelPreviewStatus.setText("Opening video source...")
+        threading.Thread(target=self._open_source, args=(factory,), name="cammy-open", daemon=True).start()
+
+    def _open_source(self, factory):
+        # background thread. anything going wrong has to come back as a message, or Connect stays disabled
+        try:
+            source = factory()
+        except Exception as e:
+            self.sourceOpened.emit(None, None, f"Could not open the video source: {e}")
+            return
+        try:
+            mode = source.mode()
+        except Exception as e:
+            self.sourceOpened.emit(source, None, f"Could not read the video source's mode: {e}")
+            return
+        if self.closing:
+            source.release() # nobody left to take it, don't leave scrcpy running
+            return
+        self.sourceOpened.emit(source, mode, "")
+
+    def _source_failed(self, source, message):
+        if source is not None:
+            source.release()
+        self.ui.textEditStatus.append(message)
+        self.ui.labelPreviewStatus.setText("No video signal")
+        self.ui.btnConnect.setEnabled(True)
+
+    def _on_source_opened(self, source, mode, error):
+        self.opening_source = False
+        if error:
+            self._source_failed(source, error)
+            return
+        width, height, fps = mode
+        if self.resolution is None or self.fps is None:
+            # nothing typed in, go with the mode the camera (or phone) opened in
+            if self.resolution is None:
+                if not width or not height:
+                    self._source_failed(source, "No video from the source, is the device streaming?")
+                    return
+                self.resolution = [width, height]
+                self.ui.lineEditResolution.setText(f"{width}x{height}")
+            if self.fps is None:
+                self.fps = int(fps) or 30
+                self.ui.lineEditFPS.setText(f"{self.fps}")
 
-        # Pretty self explanatory. Also there is a bug that the virtual cam is resized to 4:3 ratio. I can't seem to find the problem so do check it out ;)
+        try:
+            sinks = self._sinks_factory(source.pixel_format)()
+        except Exception as e: # pyvirtualcam raises RuntimeError when there's no loopback device
+            self._source_failed(source, f"Could not open the output: {e}")
+            return
         if self.virtual_cam_enabled:
-            self.virtual_cam = pyvirtualcam.Camera(
-                width=self.resolution[0], 
-                height=self.resolution[1], 
-                fps=int(self.fps),
-                fmt=pyvirtualcam.PixelFormat.RGB
-            )
-            self.ui.textEditStatus.append("VirtualCamera started") 
+            self.ui.textEditStatus.append("VirtualCamera started")
+
+        self.processor.output_size = (self.resolution[0], self.resolution[1])
+        self.pipeline = FramePipeline(
+            source,
+            self.processor,
+            self.fps,
+            sinks=sinks,
+            on_preview=self.preview.offer,
+            stats=self.stats,
+            on_error=self.pipelineError.emit,
+        )
+        self.stats.reset()
+        self.quality.reset(self.fps)
+        self.stats_sent = 0
+        self.reconfigs_seen = 0
+        self._update_preview_visibility()
+        self.preview.start()
+        self.pipeline.start()
+        self.statsTimer.start()
+        self._update_recording()
+        self._update_frame_bus()
 
         self.ui.textEditStatus.append("Camera started")
         self.ui.btnConnect.setEnabled(False)
         self.ui.btnDisconnect.setEnabled(True)
 
+    def _source_factory(self):
+        # () -> source for the current settings. everything that reads the UI happens now, on the GUI
+        # thread, so the factory itself can run on the pipeline's capture thread (see _reconfigure)
+        resolution, fps = self.resolution, self.fps
+        if not self.ui.checkBoxUSB.isChecked():
+            fourcc = None
+            if self.camera_caps and resolution:
+                fourcc = camera_caps.find_mode(self.camera_caps, resolution[0], resolution[1], fps)
+            if fourcc == "MJPG":
+                # only MJPEG can do this mode. decode it on a few cores instead of inside cap.read()
+                return lambda: MjpegCameraSource(CAMERA_INDEX, resolution, fps)
+            return lambda: CameraSource(CAMERA_INDEX, resolution, fps, fourcc)
+
+        # phone over adb: scrcpy's stream decoded right here, no v4l2loopback in between
+        serial = self.ui.tab_main.connected_serial
+        if not serial:
+            self.ui.textEditStatus.append("Connect to a device on the Main tab first")
+            return None
+        if self.mode_from_caps:
+            # that's the webcam's mode, not the phone's. take whatever the phone sends instead
+            self.mode_from_caps = False
+            self.resolution = self.fps = resolution = fps = None
+            self.ui.lineEditResolution.setText("")
+            self.ui.lineEditFPS.setText("")
+        bitrate = f"{self.ui.spinBoxBitrate.value()}K"
+        self.ui.textEditStatus.append(f"Receiving video from {serial}")
+        return lambda: ScrcpySource(serial, max_fps=fps, bitrate=bitrate, max_size=max(resolution) if resolution else None)
+
+    def _sinks_factory(self, pixel_format="BGR"):
+        width, height = self.resolution
+        fps = self.fps
+        enabled = self.virtual_cam_enabled
+        return lambda: [VirtualCamSink(width, height, fps, pixel_format)] if enabled else []
+
+    def _reconfigure(self, old_resolution, old_fps):
+        # Settings changed while running. Instead of stop + start (which drops the virtual cam, and video
+        # call apps see the camera vanish), only the parts that have to change get touched:
+        #   fps          output pacing right away, and the capture reopened in the new mode
+        #   resolution   capture reopened, and the virtual cam too since its format includes the size
+        # Crop/ratio/mirror never come through here, the processor picks those up on the next frame.
+        # The pipeline records how long it took until the first frame in the new setup went out.
+        started = time.perf_counter()
+        changes = {}
+        if self.fps != old_fps:
+            changes["fps"] = self.fps
+            self.quality.fps = self.fps
+        if self.resolution != old_resolution or self.fps != old_fps:
+            changes["source_factory"] = self._source_factory()
+            if changes["source_factory"] is None:
+                return
+        if self.resolution != old_resolution:
+            changes["sinks_factory"] = self._sinks_factory(self.pipeline.source.pixel_format)
+            self.processor.output_size = (self.resolution[0], self.resolution[1])
+        if not changes:
+            return
+        self.pipeline.reconfigure(started=started, **changes)
+        if "fps" in changes and self.recorder is not None:
+            # a file has one frame rate, carry on in a new recording
+            self._stop_recording()
+            self._update_recording()
+        if "sinks_factory" in changes and self.frame_bus is not None:
+            # new size, new bus. readers see the old one closed and reopen
+            self._stop_frame_bus()
+            self._update_frame_bus()
+        parts = ["capture"] + (["virtual cam"] if "sinks_factory" in changes else [])
+        self.ui.textEditStatus.append(f"Reconfiguring {' and '.join(parts)} for {self.resolution[0]}x{self.resolution[1]} @ {self.fps} fps")
+
     def _stop_camera(self):
-        self.timer.stop()
-        if self.cap:
-            self.cap.release()
-            self.cap = None
-        
-        if self.virtual_cam is not None:
-            self.virtual_cam.close()
-            self.virtual_cam = None
-        
+        self.quality.restore() # so the next start begins from the user's settings, not the degraded ones
+        self.start_when_loaded = False
+        self.statsTimer.stop()
+        self._stop_recording()
+        self._stop_frame_bus()
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
+            if self.stats.enabled:
+                self.ui.textEditStatus.append(self.stats.format())
+        self.preview.stop()
+        self.ui.labelPreviewStatus.setText("No video signal")
+
+        with self.preview_lock:
+            self.preview_frame = None
         self.ui.labelVideoPreview.clear()
         self.ui.textEditStatus.append("Camera stopped")
         self.ui.btnConnect.setEnabled(True)
         self.ui.btnDisconnect.setEnabled(False)
 
-
-    def _update_frame(self):
-        start = time.perf_counter()
-        if not self.cap:
-            return
-
-        retval, frame_bgr = self.cap.read()
-        if not retval:
+    def _on_preview_frame(self, image):
+        # called from the preview thread with an already label-sized image. dont touch widgets here
+        with self.preview_lock:
+            self.preview_frame = image
+            emit = not self.preview_pending
+            self.preview_pending = True
+        if emit:
+            self.previewReady.emit()
+
+    def _show_preview(self):
+        with self.preview_lock:
+            frame, self.preview_frame = self.preview_frame, None
+            self.preview_pending = False
+        if frame is None or not self.pipeline:
             return
 
-        frame = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-        
-        self.frame_count += 1
-        if self.frame_count % self.detection_interval == 0:
-
-            results = self.model(frame, verbose=False) # Returns Results objects in a list. The different elements of this results list point to different detected objects
-            if len(results[0].boxes) > 0: # results[n].boxes is a boxes object. Contains methods like xyxy, xywh, etc.
-                # xyxy would return xy coordinates of both left upper corner and right lower corner gives a tensor [x1, y1, x2, y2] (i dont know what tensors are so dont ask me) 1 is the upper left one, 2 is the bottom right one
-                box = results[0].boxes[0].xyxy[0].cpu().numpy() # our model processing happening in GPU by default but numpy operates in CPU. so .cpu() will move it to cpu memory and .numpy() will convert it to numpy array
-                x1, y1, x2, y2 = map(int, box)
-                self.last_cx = (x1 + x2) // 2 # mid point
-                self.last_cy = (y1 + y2) // 2 # mid point
-        
-        if self.last_cx is not None and self.last_cy is not None:
-            frame = self._center_crop(frame, self.last_cx, self.last_cy)
-
-        if self.aspectRatio and self.aspectRatio != "Auto":
-            frame = self._change_image_ratio(frame).copy()
-
-        flip_code = None
-        if self.mirror_xaxis and self.mirror_yaxis:
-            flip_code = -1
-        elif self.mirror_xaxis:
-            flip_code = 0
-        elif self.mirror_yaxis:
-            flip_code = 1
-        if flip_code is not None:
-            frame = cv2.flip(frame, flip_code)
-
-        frame = np.ascontiguousarray(frame) # I dont really understand it but it will store the frame as a contiguous block of memory but we need contiguous array to be used as a frame.otherwise boom. error.
-        
-        if self.virtual_cam is not None:
-            if frame.shape[1] != self.resolution[0] or frame.shape[0] != self.resolution[1]:
-                frame_resized = cv2.resize(frame, (self.resolution[0], self.resolution[1]))
-            else:
-                frame_resized = frame
-            self.virtual_cam.send(frame_resized)
-        
         h, w, ch = frame.shape
-        qimg = QtGui.QImage(frame.data, w, h, w * ch, QtGui.QImage.Format.Format_RGB888).copy() # I honestly don't understand what the fuck is going on here. I copied this off stackoverflow
-        self.ui.labelVideoPreview.setPixmap(
-            QtGui.QPixmap.fromImage(qimg).scaled(
-                self.ui.labelVideoPreview.size(),
-                QtCore.Qt.AspectRatioMode.KeepAspectRatio
-            )
-        )
-        print(time.perf_counter() - start)
+        # QImage just points at the numpy array, fromImage() does the one copy into the pixmap.
+        # already label sized so no scaling here
+        qimg = QtGui.QImage(frame.data, w, h, w * ch, PREVIEW_FORMATS[self.pipeline.source.pixel_format])
+        self.ui.labelVideoPreview.setPixmap(QtGui.QPixmap.fromImage(qimg))
 
-    def _center_crop(self, frame, cx, cy):
-        # suppose values of cx cy and everythin else. U wil understand.
-        h, w, _ = frame.shape
-
-        crop_w = int(w/2)
-        crop_h = int(h/2)
-
-        x1 = max(0, cx - crop_w//2)
-        y1 = max(0, cy - crop_h//2)
-
-        x2 = min(w, x1 + crop_w)
-        y2 = min(h, y1 + crop_h)
+    def _show_stats(self):
+        if not self.stats.enabled:
+            return
+        summary = self.stats.summary()
+        stages = summary["stages"]
+        sent = stages.get("send", {}).get("count", 0)
+        fps = sent - self.stats_sent
+        self.stats_sent = sent
+
+        parts = [f"{fps} fps"]
+        for stage in ("inference", "transform", "send"):
+            if stage in stages:
+                parts.append(f"{stage} p95 {stages[stage]['p95']:.1f} ms")
+        dropped = sum(value for name, value in summary["counters"].items() if name.endswith("dropped"))
+        parts.append(f"{dropped} dropped")
+        if self.recorder is not None:
+            parts.append(f"rec lag {self.recorder.lag * 1000:.0f} ms")
+            if self.recorder.error:
+                self.ui.textEditStatus.append(f"Recording failed: {self.recorder.error}")
+                self.ui.checkBoxRecord.setChecked(False)
+        if self.quality.level:
+            parts.append(f"quality -{self.quality.level}")
+        reconfigs = stages.get("reconfigure", {}).get("count", 0)
+        if reconfigs > self.reconfigs_seen:
+            self.reconfigs_seen = reconfigs
+            self.ui.textEditStatus.append(f"Reconfigured in {self.stats.percentile('reconfigure', 50, last=1):.0f} ms")
+        self.ui.labelPreviewStatus.setText("  |  ".join(parts))
+        self.quality.update()
+
+    def _update_low_latency(self):
+        self.quality.enabled = self.ui.checkBoxLowLatency.isChecked()
+        if not self.quality.enabled:
+            self.quality.restore()
+
+    def shutdown(self):
+        # window closing (MainWindow.closeEvent). everything has to be stopped here: the recorder's encoder
+        # thread isn't a daemon and would keep the process alive, and ffmpeg needs its EOF to finish the file
+        self.closing = True
+        recorder = self.recorder
+        if self.pipeline:
+            self._stop_camera()
+        self._stop_recording()
+        self._stop_frame_bus()
+        if recorder is not None and not recorder.join(RECORDING_CLOSE_TIMEOUT):
+            recorder.abort()
+            recorder.join(2)
+
+    def _update_recording(self):
+        if not self.ui.checkBoxRecord.isChecked():
+            self._stop_recording()
+            return
+        if self.pipeline is None or self.recorder is not None:
+            return # starts with the camera
+        try:
+            self.recorder = RecordingSink(RECORDING_PATH, self.fps, segment_seconds=RECORDING_SEGMENT, stats=self.stats)
+        except (OSError, ValueError) as e:
+            self.ui.textEditStatus.append(f"Could not start recording: {e}")
+            return
+        self.pipeline.attach(self.recorder)
+        self.ui.textEditStatus.append(f"Recording with {self.recorder.encoder}")
 
-        return frame[y1:y2, x1:x2]
+    def _stop_recording(self):
+        if self.recorder is None:
+            return
+        if self.pipeline:
+            self.pipeline.detach(self.recorder)
+        self.recorder.close() # the encoder finishes the file in the background
+        files = self.recorder.segments
+        if files:
+            more = f" and {len(files) - 1} more" if len(files) > 1 else ""
+            dropped = f", {self.recorder.dropped} frames dropped" if self.recorder.dropped else ""
+            self.ui.textEditStatus.append(f"Recording saved to {files[0]}{more}{dropped}")
+        self.recorder = None
+
+    def _update_frame_bus(self):
+        if not self.ui.checkBoxFrameBus.isChecked():
+            self._stop_frame_bus()
+            return
+        if self.pipeline is None or self.frame_bus is not None:
+            return # starts with the camera
+        try:
+            self.frame_bus = FrameBusSink(self.resolution[0], self.resolution[1], FRAME_BUS_NAME)
+        except (OSError, ValueError) as e:
+            self.ui.textEditStatus.append(f"Could not share the output: {e}")
+            return
+        self.pipeline.attach(self.frame_bus)
+        self.ui.textEditStatus.append(f"Sharing the output as frame bus '{FRAME_BUS_NAME}'")
 
+    def _stop_frame_bus(self):
+        if self.frame_bus is None:
+            return
+        if self.pipeline:
+            self.pipeline.detach(self.frame_bus)
+        self.frame_bus.close()
+        self.frame_bus = None
 
-    def _change_image_ratio(self, frame):
-        h, w, _ = frame.shape
-        parts = self.aspectRatio.split(":")
-        target_ratio = float(parts[0]) / float(parts[1])
-        current_ratio = w / h
+    def export_stats(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self.ui, "Export Stats", "cammy_stats.csv", "CSV Files (*.csv);;JSON Files (*.json)"
+        )
+        if not path:
+            return
 
-        if current_ratio > target_ratio:
-            new_w  = int(h * target_ratio)
-            offset = (w - new_w) // 2
-            return frame[:, offset:offset + new_w]
+        if path.endswith(".json"):
+            self.stats.export_json(path)
         else:
-            new_h  = int(w / target_ratio)
-            offset = (h - new_h) // 2
-            return frame[offset:offset + new_h, :]
+            self.stats.export_csv(path)
+
+        self.ui.textEditStatus.append(f"Stats exported to {path}")
+
+    def _update_preview_visibility(self):
+        on_tab = self.ui.tabWidget.currentWidget() is self.ui.CammyPage
+        if on_tab:
+            self._ensure_model() # first time the tab is opened, start loading in the background
+        self.preview.visible = (
+            self.ui.isVisible()
+            and not self.ui.isMinimized()
+            and on_tab
+        )
 
+    def eventFilter(self, obj, event):
+        if obj is self.ui.labelVideoPreview and event.type() == QtCore.QEvent.Type.Resize:
+            size = self.ui.labelVideoPreview.contentsRect().size()
+            self.preview.target_size = (size.width(), size.height())
+        elif obj is self.ui and event.type() in (
+            QtCore.QEvent.Type.WindowStateChange,
+            QtCore.QEvent.Type.Show,
+            QtCore.QEvent.Type.Hide,
+        ):
+            self._update_preview_visibility()
+        return False
 
     def _update_fps(self):
         try:
-            self.fps = int(self.ui.lineEditFPS.text())
+            fps = int(self.ui.lineEditFPS.text())
         except ValueError:
             return
-        if self.cap:
-            self._stop_camera()
-            self._start_camera()
+        if not self._supported(self.resolution, fps):
+            rates = ", ".join(f"{int(rate)}" for rate in camera_caps.frame_rates(self.camera_caps, *self.resolution))
+            self.ui.textEditStatus.append(f"Camera can't do {fps} fps at {self.resolution[0]}x{self.resolution[1]}. Supported: {rates}")
+            self.ui.lineEditFPS.setText(f"{int(self.fps)}" if self.fps else "")
+            return
+        old_fps, self.fps = self.fps, fps
+        self.mode_from_caps = False
+        if self.pipeline:
+            self._reconfigure(self.resolution, old_fps)
 
     def _update_resolution(self):
         try:
-            self.resolution = [int(x) for x in self.ui.lineEditResolution.text().split("x")]
+            resolution = [int(x) for x in self.ui.lineEditResolution.text().split("x")]
         except ValueError:
             return
-        if self.cap:
-            self._stop_camera()
-            self._start_camera()
+        if len(resolution) != 2 or min(resolution) <= 0:
+            self.ui.textEditStatus.append("Resolution should look like 1280x720")
+            return
+        if not self._supported(resolution, None):
+            self.ui.textEditStatus.append(f"Camera doesn't support {resolution[0]}x{resolution[1]}. Supported: {', '.join(camera_caps.resolutions(self.camera_caps))}")
+            self.ui.lineEditResolution.setText(f"{self.resolution[0]}x{self.resolution[1]}" if self.resolution else "")
+            return
+        old_resolution, old_fps = self.resolution, self.fps
+        self.resolution = resolution
+        self.mode_from_caps = False
+        self._update_fps_completer()
+        if self.fps and not self._supported(resolution, self.fps):
+            # keep the fps the camera can actually do at the new size
+            rates = camera_caps.frame_rates(self.camera_caps, *resolution)
+            self.fps = int(rates[0]) if rates else self.fps
+            self.ui.lineEditFPS.setText(f"{self.fps}")
+        if self.pipeline:
+            self._reconfigure(old_resolution, old_fps)
 
     def _update_aspect_ratio(self):
-        self.aspectRatio = self.ui.comboBoxAspectRatio.currentText()
+        self.processor.aspect_ratio = self.ui.comboBoxAspectRatio.currentText()
 
     def _update_mirror_x(self):
-        self.mirror_xaxis = self.ui.checkBoxMirror_xaxis.isChecked()
+        self.processor.mirror_xaxis = self.ui.checkBoxMirror_xaxis.isChecked()
 
     def _update_mirror_y(self):
-        self.mirror_yaxis = self.ui.checkBoxMirror_yaxis.isChecked()
+        self.processor.mirror_yaxis = self.ui.checkBoxMirror_yaxis.isChecked()
 
 
     def save_settings(self):
@@ -219,6 +608,10 @@ class TabCammy:
             "mirror_video_yaxis": self.ui.checkBoxMirror_yaxis.isChecked(),
             "mirror_video_xaxis": self.ui.checkBoxMirror_xaxis.isChecked(),
             "keep_device_awake": self.ui.checkBoxKeepAwake.isChecked(),
+            "connect_via_usb": self.ui.checkBoxUSB.isChecked(),
+            "low_latency": self.ui.checkBoxLowLatency.isChecked(),
+            "record_output": self.ui.checkBoxRecord.isChecked(),
+            "share_output": self.ui.checkBoxFrameBus.isChecked(),
         }
 
         path, _ = QFileDialog.getSaveFileName(
@@ -253,5 +646,9 @@ class TabCammy:
         self.ui.checkBoxMirror_yaxis.setChecked(bool(data.get("mirror_video_yaxis", False)))
         self.ui.checkBoxMirror_xaxis.setChecked(bool(data.get("mirror_video_xaxis", False)))
         self.ui.checkBoxKeepAwake.setChecked(bool(data.get("keep_device_awake", False)))
+        self.ui.checkBoxUSB.setChecked(bool(data.get("connect_via_usb", False)))
+        self.ui.checkBoxLowLatency.setChecked(bool(data.get("low_latency", False)))
+        self.ui.checkBoxRecord.setChecked(bool(data.get("record_output", False)))
+        self.ui.checkBoxFrameBus.setChecked(bool(data.get("share_output", False)))
 
         self.ui.textEditStatus.append("Settings loaded")
\ No newline at end of file
@@ -1,7 +1,10 @@
-from PyQt6 import QtCore
-import subprocess
+from PyQt6 import QtCore, QtWidgets
 import shlex
-import time
+
+from device_tracker import DeviceTracker
+from log_sink import LogSink
+from session_manager import SessionManager
+from wifi_handoff import WifiHandoff
 
 
 class TabMain(QtCore.QObject):
@@ -9,12 +12,19 @@ class TabMain(QtCore.QObject):
         super().__init__(ui)
         self.ui = ui
 
-        self.scrcpyProcess = None
+        # several phones can be connected (and streaming) at once, each is a session in self.sessions.
+        # connected_serial is the one the battery bar shows and the Cammy tab takes video from
         self.connected_serial = None
+        self.handoff = None
+        self.handoff_streaming = False # the USB serial was streaming when the handoff started
+
+        # everything for textTerminal goes through here: batched into the pane ~10x a second, capped
+        # at max_lines lines, and all of it kept in a rotating file (see log_sink.py)
+        self.terminal = LogSink(self.ui.textTerminal, max_lines=2000)
+        self.ui.destroyed.connect(self.terminal.close)
 
-        self.refreshTimer = QtCore.QTimer(self.ui)
-        self.refreshTimer.setInterval(2000)
-        self.refreshTimer.timeout.connect(self.refresh)
+        # ctrl/shift click to pick more than one device
+        self.ui.listADBDevices.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
 
         self.ui.refreshButtonADB.clicked.connect(self.list_adb_devices)
         self.ui.connectButtonADB.clicked.connect(self.connect_to_device)
@@ -23,76 +33,122 @@ class TabMain(QtCore.QObject):
         self.ui.buttonStopScrcpy.clicked.connect(self.stop_scrcpy)
         self.ui.switchToTCPIP.clicked.connect(self.switch_scrcpy_tcp_ip)
 
+        # the adb server tells us when devices come and go, listADBDevices just follows along
+        self.tracker = DeviceTracker(self)
+        self.tracker.deviceAdded.connect(self.on_device_added)
+        self.tracker.deviceRemoved.connect(self.on_device_removed)
+        self.tracker.deviceStateChanged.connect(self.on_device_state_changed)
+        self.tracker.trackerError.connect(self.log)
+        self.tracker.start()
+        self.ui.destroyed.connect(self.tracker.stop)
+
+        # scrcpy processes, restarts and battery/thermal for every connected device, see session_manager.py
+        self.sessions = SessionManager(self)
+        self.sessions.sessionOutput.connect(self.on_scrcpy_output)
+        self.sessions.sessionMessage.connect(lambda serial, message: self.log(f"[{serial}] {message}"))
+        self.sessions.sessionState.connect(self.on_session_state)
+        self.sessions.telemetryUpdated.connect(self.on_telemetry)
+        self.ui.destroyed.connect(self.sessions.shutdown)
+
     def log(self, text):
-        self.ui.textTerminal.append(text)
-
-    def read_process_output(self, process):
-        out = process.readAllStandardOutput().data().decode(errors="replace")
-        err = process.readAllStandardError().data().decode(errors="replace")
-        if out:
-            for line in out.splitlines():
-                self.log(f"[scrcpy] {line}")
-        if err:
-            for line in err.splitlines():
-                self.log(f"[scrcpy-err] {line}")
+        self.terminal.write(text)
+
+    def on_scrcpy_output(self, serial, line, is_error):
+        prefix = "scrcpy-err" if is_error else "scrcpy"
+        self.log(f"[{prefix} {serial}] {line}")
+
+    def on_session_state(self, serial, state):
+        if state == "idle":
+            self.log(f"[{serial}] scrcpy stopped.")
+        elif state == "failed":
+            self.log(f"[{serial}] scrcpy failed.")
 
     def list_adb_devices(self):
+        # rebuilds the list from what the tracker last heard. the tracker keeps it current on its own,
+        # this is just the refresh button
         self.ui.listADBDevices.clear()
-        completed = subprocess.run(["adb", "devices"], capture_output=True, text=True, check=True)
-        lines = completed.stdout.strip().splitlines()
-        for line in lines[1:]:
-            if not line.strip():
-                continue
-            parts = line.split()
-            if len(parts) >= 1:
-                serial = parts[0]
-                self.ui.listADBDevices.addItem(serial)
+        for serial, state in dict(self.tracker.devices).items():
+            self.on_device_added(serial, state)
 
-    def connect_to_device(self):
+    def find_device_item(self, serial):
+        for i in range(self.ui.listADBDevices.count()):
+            item = self.ui.listADBDevices.item(i)
+            if item.text() == serial:
+                return item
+        return None
+
+    def selected_serials(self):
+        serials = [item.text() for item in self.ui.listADBDevices.selectedItems()]
         item = self.ui.listADBDevices.currentItem()
-        if not item:
+        if not serials and item:
+            serials = [item.text()]
+        return serials
+
+    def on_device_added(self, serial, state):
+        if self.find_device_item(serial) is None:
+            self.ui.listADBDevices.addItem(serial)
+        self.on_device_state_changed(serial, state)
+
+    def on_device_removed(self, serial):
+        item = self.find_device_item(serial)
+        if item is not None:
+            self.ui.listADBDevices.takeItem(self.ui.listADBDevices.row(item))
+        if serial in self.sessions.sessions:
+            self.log(f"Device {serial} disconnected.")
+            self.sessions.remove(serial)
+            if serial == self.connected_serial:
+                self.set_primary(next(iter(self.sessions.sessions), None))
+
+    def on_device_state_changed(self, serial, state):
+        item = self.find_device_item(serial)
+        if item is not None:
+            item.setToolTip(state) # device / unauthorized / offline ...
+        if state != "device":
+            self.log(f"{serial}: {state}")
+
+    def set_primary(self, serial):
+        self.connected_serial = serial
+        self.ui.batteryPercentage.setValue(0)
+        self.ui.batteryPercentage.setFormat("%p%")
+        self.ui.batteryPercentage.setToolTip("")
+        if serial and serial in self.sessions.sessions:
+            telemetry = self.sessions.sessions[serial].last_telemetry
+            if telemetry:
+                self.on_telemetry(serial, telemetry)
+
+    def connect_to_device(self):
+        serials = self.selected_serials()
+        if not serials:
             self.log("No device selected.")
             return
-        self.connected_serial = item.text()
-        self.log(f"Connected to {self.connected_serial}")
-        self.refreshTimer.start()
+        for serial in serials:
+            self.sessions.add(serial)
+            self.log(f"Connected to {serial}")
+        current = self.ui.listADBDevices.currentItem()
+        self.set_primary(current.text() if current and current.text() in serials else serials[0])
 
     def disconnect_device(self):
-        self.refreshTimer.stop()
-        self.stop_scrcpy()
-        self.connected_serial = None
-        self.ui.batteryPercentage.setValue(0)
+        for serial in list(self.sessions.sessions):
+            self.sessions.remove(serial)
+        self.set_primary(None)
         self.log("Device disconnected.")
 
-    def refresh(self):
-        if not self.connected_serial:
-            return
-        if self.scrcpyProcess and self.scrcpyProcess.state() == QtCore.QProcess.ProcessState.NotRunning:
-            self.log("scrcpy process ended.")
-            self.scrcpyProcess = None
-        self.refresh_battery()
-
-    def refresh_battery(self):
-        result = subprocess.run([
-            "adb", "-s", self.connected_serial, "shell", "dumpsys", "battery"
-        ], capture_output=True, text=True, timeout=3)
-        if result.returncode != 0 or not result.stdout:
-            self.log("Device lost during battery check.")
-            self.disconnect_device()
-            return
-        for line in result.stdout.splitlines():
-            if "level:" in line:
-                level = int(line.split(":", 1)[1].strip())
-                self.ui.batteryPercentage.setValue(level)
+    def on_telemetry(self, serial, telemetry):
+        if serial != self.connected_serial:
+            return # the bar only shows the primary device
+        if "level" in telemetry:
+            self.ui.batteryPercentage.setValue(telemetry["level"])
+        text = "%p%"
+        if "temperature" in telemetry:
+            text += f"  {telemetry['temperature']:.1f}\N{DEGREE SIGN}C"
+        if telemetry.get("status") in ("charging", "full"):
+            text += f"  {telemetry['status']}"
+        self.ui.batteryPercentage.setFormat(text)
+        self.ui.batteryPercentage.setToolTip(f"Thermal status: {telemetry.get('thermal') or 'unknown'}")
 
     def get_extra_options(self):
+        # bitrate and fps are handled by the session (it caps them to its budget), this is everything else
         args = []
-        bitrate = self.ui.lineBitrate.text().strip()
-        if bitrate:
-            args += ["-b", bitrate]
-        fps = self.ui.lineFPS.text().strip()
-        if fps:
-            args += ["--max-fps", fps]
         disable_control = self.ui.lineDisableControl.text().strip().lower()
         if disable_control in ("true", "1", "yes", "y"):
             args.append("--no-control")
@@ -102,88 +158,67 @@ class TabMain(QtCore.QObject):
         return args
 
     def start_scrcpy(self):
-        if self.scrcpyProcess:
-            self.log("scrcpy is already running.")
-            return
-
-        item = self.ui.listADBDevices.currentItem()
-        if not item and not self.connected_serial:
+        # one scrcpy per connected device, or for the selected ones if nothing is connected yet
+        serials = list(self.sessions.sessions) or self.selected_serials()
+        if not serials:
             self.log("No device selected.")
             return
+        if self.connected_serial is None:
+            self.set_primary(serials[0])
 
-        serial = self.connected_serial or item.text()
-        arguments = ["-s", serial] + self.get_extra_options()
-
-        self.scrcpyProcess = QtCore.QProcess(self.ui)
-        self.scrcpyProcess.setProgram("scrcpy")
-        self.scrcpyProcess.setArguments(arguments)
-
-        self.scrcpyProcess.readyReadStandardOutput.connect(
-            lambda: self.read_process_output(self.scrcpyProcess)
-        )
-        self.scrcpyProcess.readyReadStandardError.connect(
-            lambda: self.read_process_output(self.scrcpyProcess)
-        )
-        self.scrcpyProcess.finished.connect(self.on_scrcpy_finished)
-
-        self.scrcpyProcess.start()
-
-        self.log(f"scrcpy started: scrcpy {' '.join(arguments)}")
-
+        running = self.sessions.streaming()
+        for serial in serials:
+            if serial in running:
+                self.log(f"scrcpy is already running for {serial}.")
+                continue
+            self.sessions.start_stream(serial, **self.stream_options())
 
-    def on_scrcpy_finished(self):
-        self.log(f"scrcpy finished")
-        self.scrcpyProcess = None
+    def stream_options(self):
+        return {
+            "bitrate": self.ui.lineBitrate.text().strip() or None,
+            "max_fps": self.ui.lineFPS.text().strip() or None,
+            "extra_args": self.get_extra_options(),
+        }
 
     def stop_scrcpy(self):
-        if self.scrcpyProcess:
-            self.scrcpyProcess.terminate()
-            if not self.scrcpyProcess.waitForFinished(1000):
-                self.scrcpyProcess.kill()
-            self.scrcpyProcess = None
-            self.log("scrcpy stopped.")
+        for serial in self.sessions.streaming():
+            self.sessions.stop_stream(serial)
 
     def switch_scrcpy_tcp_ip(self):
+        if self.handoff:
+            self.log("Already switching to TCP/IP.")
+            return
         item = self.ui.listADBDevices.currentItem()
         if not item and not self.connected_serial:
             self.log("No device selected for TCP/IP switch.")
             return
         serial = self.connected_serial or item.text()
-        try:
-            self.log(f"Enabling adb tcpip on {serial}...")
-            subprocess.run(["adb", "-s", serial, "tcpip", "5555"], check=True, capture_output=True, text=True, timeout=6)
-        except Exception as e:
-            self.log(f"tcpip enable failed: {e}")
-            return
-        
-        time.sleep(1.0)
-        completed = subprocess.run(["adb", "-s", serial, "shell", "ip", "route", "get", "1"], capture_output=True, text=True, timeout=3)
-        out = completed.stdout or completed.stderr or ""
-        tokens = out.split()
-        for i, t in enumerate(tokens):
-            if t == "src" and i + 1 < len(tokens):
-                ip = tokens[i + 1]
-                break
-            
-        addr = f"{ip}:5555"
-        self.log(f"Connecting to {addr}...")
-        completed = subprocess.run(["adb", "connect", addr], capture_output=True, text=True, timeout=6)
-        if completed.returncode != 0:
-            self.log(f"adb connect failed: {completed.stdout or completed.stderr}")
-            return
-        
-        time.sleep(0.6)
-        self.list_adb_devices()
-        found_serial = None
-        for i in range(self.ui.listADBDevices.count()):
-            txt = self.ui.listADBDevices.item(i).text()
-            if addr in txt or txt.startswith(ip + ":"):
-                found_serial = txt
-                break
-        if not found_serial:
-            found_serial = addr
-        self.connected_serial = found_serial
-        self.log(f"Wireless device ready: {found_serial}")
-        self.stop_scrcpy()
-        self.start_scrcpy()
-        self.list_adb_devices()
+        # tcpip restarts adbd, which takes a USB scrcpy down with it. stop it first so its restart policy
+        # doesn't keep relaunching it on a transport that's going away, on_handoff_failed brings it back
+        session = self.sessions.sessions.get(serial)
+        self.handoff_streaming = session is not None and session.state in ("running", "backoff")
+        if self.handoff_streaming:
+            self.sessions.stop_stream(serial)
+        # runs on its own thread and polls until the wireless transport is really up, see wifi_handoff.py
+        self.handoff = WifiHandoff(serial, self)
+        self.handoff.progress.connect(lambda state, message: self.log(message))
+        self.handoff.finished.connect(self.on_handoff_finished)
+        self.handoff.failed.connect(self.on_handoff_failed)
+        self.handoff.start()
+
+    def on_handoff_finished(self, serial):
+        usb_serial = self.handoff.serial
+        self.handoff = None
+        self.log(f"Wireless device ready: {serial}")
+        # the wireless transport is confirmed, so scrcpy only has to (re)start once, on the new serial
+        self.sessions.remove(usb_serial)
+        self.set_primary(serial)
+        self.sessions.start_stream(serial, **self.stream_options())
+
+    def on_handoff_failed(self, message):
+        usb_serial = self.handoff.serial
+        self.handoff = None
+        self.log(message)
+        if self.handoff_streaming:
+            # still on USB, pick the stream back up there
+            self.sessions.start_stream(usb_serial, **self.stream_options())
@@ -0,0 +1,143 @@
+import itertools
+import socket
+import time
+
+from adb_client import AdbClient
+
+# Battery / thermal telemetry over one long-lived shell per device instead of an `adb shell dumpsys`
+# process every tick.
+#
+# ShellSession opens "exec:sh" on the device through the adb server (no pty, so no echo and no
+# prompt to strip) and keeps it open. Every command is followed by an echo of a unique marker so we
+# know where its output ends. If a command times out the session stays open: its output is still
+# coming, and gets thrown away when the next command's read runs into the old marker.
+
+MARKER = "__opc_done_"
+
+BATTERY_STATUS = {1: "unknown", 2: "charging", 3: "discharging", 4: "not charging", 5: "full"}
+THERMAL_STATUS = {0: "none", 1: "light", 2: "moderate", 3: "severe", 4: "critical", 5: "emergency", 6: "shutdown"}
+
+
+class TelemetryTimeout(Exception):
+    pass
+
+
+class ShellSession:
+    def __init__(self, serial, client=None):
+        self.serial = serial
+        self.client = client or AdbClient()
+        self.sock = None
+        self.buffer = b""
+        self.ids = itertools.count()
+
+    @property
+    def is_open(self):
+        return self.sock is not None
+
+    def open(self):
+        self.close()
+        sock = self.client.connect()
+        try:
+            self.client.request(sock, f"host:transport:{self.serial}")
+            self.client.request(sock, "exec:sh")
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.buffer = b""
+
+    def run(self, command, timeout=3.0):
+        # runs one shell command and returns its stdout. TelemetryTimeout leaves the session usable,
+        # anything else (OSError, AdbError) means the session is gone and has been closed
+        if self.sock is None:
+            self.open()
+        marker = f"{MARKER}{next(self.ids)}"
+        try:
+            self.sock.sendall(f"{command} 2>/dev/null; echo {marker}\n".encode())
+            return self._read_until(marker, time.monotonic() + timeout)
+        except TelemetryTimeout:
+            raise
+        except Exception:
+            self.close()
+            raise
+
+    def _read_until(self, marker, deadline):
+        lines = []
+        while True:
+            while b"\n" in self.buffer:
+                line, self.buffer = self.buffer.split(b"\n", 1)
+                line = line.decode(errors="replace").rstrip("\r")
+                if line == marker:
+                    return "\n".join(lines)
+                if line.startswith(MARKER):
+                    lines = [] # end of a command that timed out earlier, everything so far was its output
+                    continue
+                lines.append(line)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TelemetryTimeout(f"{self.serial}: no answer in time")
+            self.sock.settimeout(remaining)
+            try:
+                chunk = self.sock.recv(65536)
+            except socket.timeout:
+                raise TelemetryTimeout(f"{self.serial}: no answer in time") from None
+            if not chunk:
+                raise ConnectionError(f"{self.serial}: shell closed")
+            self.buffer += chunk
+
+
+def parse_battery(text):
+    values = {}
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition(":")
+        if sep:
+            values[key.strip()] = value.strip()
+
+    telemetry = {}
+    if values.get("level", "").isdigit():
+        telemetry["level"] = int(values["level"])
+    if values.get("temperature", "").lstrip("-").isdigit():
+        telemetry["temperature"] = int(values["temperature"]) / 10 # dumpsys reports tenths of a degree
+    if values.get("status", "").isdigit():
+        telemetry["status"] = BATTERY_STATUS.get(int(values["status"]), "unknown")
+    telemetry["plugged"] = any(values.get(f"{kind} powered") == "true" for kind in ("AC", "USB", "Wireless", "Dock"))
+    return telemetry
+
+
+def parse_thermal(text):
+    # "Thermal Status: 2" in `dumpsys thermalservice`, Android 10+. older devices just print nothing
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition(":")
+        if sep and key.strip() == "Thermal Status" and value.strip().isdigit():
+            return THERMAL_STATUS.get(int(value.strip()), value.strip())
+    return None
+
+
+class TelemetrySession:
+    # battery + thermal for one device over a ShellSession
+    def __init__(self, serial, client=None, timeout=3.0):
+        self.serial = serial
+        self.shell = ShellSession(serial, client)
+        self.timeout = timeout
+
+    def poll_once(self):
+        # returns {"level", "temperature", "status", "plugged", "thermal"} (missing keys if the device
+        # didn't say). raises TelemetryTimeout, or OSError/AdbError if the device went away
+        telemetry = parse_battery(self.shell.run("dumpsys battery", self.timeout))
+        try:
+            telemetry["thermal"] = parse_thermal(self.shell.run("dumpsys thermalservice", self.timeout))
+        except TelemetryTimeout:
+            telemetry["thermal"] = None # thermalservice can be slow to dump, not worth failing the poll over
+        return telemetry
+
+    def close(self):
+        self.shell.close()
@@ -0,0 +1,110 @@
+import threading
+import time
+from PyQt6 import QtCore
+
+from adb_client import AdbClient, AdbError
+
+# USB -> Wi-Fi handoff for a device, off the GUI thread:
+#
+#   find_ip     ask the device for its Wi-Fi address while it's still on USB (ip route get 1)
+#   tcpip       tell adbd to restart listening on TCP
+#   connect     retry host:connect:<ip>:<port> until adbd is back up and accepts it
+#   wait_online wait until the server lists the new transport as "device" (not offline/unauthorized)
+#
+# Every step polls every `poll_interval` instead of sleeping for a fixed amount, so the whole thing
+# takes as long as the device needs and no longer. Each state is a method returning the next one,
+# run() is synchronous so it can be driven directly against a fake client.
+
+DEFAULT_PORT = 5555
+
+
+class HandoffError(Exception):
+    pass
+
+
+class WifiHandoff(QtCore.QObject):
+    progress = QtCore.pyqtSignal(str, str) # state, message
+    finished = QtCore.pyqtSignal(str)      # serial of the wireless transport
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, serial, parent=None, client=None, port=DEFAULT_PORT, timeout=15.0, poll_interval=0.2):
+        super().__init__(parent)
+        self.serial = serial
+        self.client = client or AdbClient()
+        self.port = port
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.state = "find_ip"
+        self.ip = None
+        self.address = None
+        self.cancelled = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="wifi-handoff", daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        deadline = time.monotonic() + self.timeout
+        self.progress.emit(self.state, f"Looking up the Wi-Fi address of {self.serial}...")
+        try:
+            while self.state != "done":
+                if self.cancelled.is_set():
+                    raise HandoffError("cancelled")
+                if time.monotonic() > deadline:
+                    raise HandoffError(f"timed out while in {self.state}")
+                next_state = getattr(self, f"_{self.state}")()
+                if next_state is None:
+                    self.cancelled.wait(self.poll_interval) # not ready yet, poll again
+                else:
+                    self.state = next_state
+        except (HandoffError, AdbError, OSError) as e:
+            self.state = "failed"
+            self.failed.emit(f"Wi-Fi switch failed: {e}")
+            return
+        self.finished.emit(self.address)
+
+    def _find_ip(self):
+        output = self.client.shell(self.serial, "ip route get 1", timeout=3)
+        self.ip = parse_route_ip(output)
+        if self.ip is None:
+            # no default route usually means Wi-Fi is off
+            raise HandoffError(f"could not find the device's IP address (is Wi-Fi on?): {output.strip()!r}")
+        self.address = f"{self.ip}:{self.port}"
+        self.progress.emit("tcpip", f"Enabling adb tcpip on {self.serial}...")
+        return "tcpip"
+
+    def _tcpip(self):
+        reply = self.client.device_service(self.serial, f"tcpip:{self.port}", timeout=6)
+        if "restarting" not in reply and "already" not in reply:
+            raise HandoffError(reply.strip() or "tcpip was refused")
+        self.progress.emit("connect", f"Connecting to {self.address}...")
+        return "connect"
+
+    def _connect(self):
+        # adbd is restarting, refused connections are expected for a moment
+        reply = self.client.query(f"host:connect:{self.address}")
+        if reply.startswith("connected to") or reply.startswith("already connected"):
+            self.progress.emit("wait_online", f"Waiting for {self.address} to come online...")
+            return "wait_online"
+        return None
+
+    def _wait_online(self):
+        state = self.client.devices().get(self.address)
+        if state == "device":
+            return "done"
+        if state == "unauthorized":
+            raise HandoffError(f"{self.address} is unauthorized, accept the prompt on the device")
+        return None
+
+
+def parse_route_ip(output):
+    # "1.0.0.0 via 192.168.1.1 dev wlan0 table 1021 src 192.168.1.23 uid 2000" -> "192.168.1.23"
+    tokens = output.split()
+    for i, token in enumerate(tokens[:-1]):
+        if token == "src":
+            return tokens[i + 1]
+    return None
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# the app runs from src/ with flat imports, do the same here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fake_adb import FakeAdbServer # noqa: E402
+
+
+@pytest.fixture
+def qapp():
+    QtCore = pytest.importorskip("PyQt6.QtCore")
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def adb_server():
+    server = FakeAdbServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+def wait_for(condition, timeout=5.0, app=None):
+    # polls condition(), running the Qt event loop in between if there is one
+    import time
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        if app is not None:
+            app.processEvents()
+        time.sleep(0.01)
+    return True
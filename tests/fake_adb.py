@@ -0,0 +1,189 @@
+import socket
+import threading
+
+# A small stand-in for the adb server, enough of the smart socket protocol for adb_client.py and
+# what's built on it:
+#
+#   host:version, host:devices, host:track-devices (pushes the list again on every set_devices())
+#   host:connect:<addr>       answers from connect_replies, then "connected to <addr>". a successful
+#                             connect adds <addr> to the devices with state connect_state
+#   host:transport:<serial>   then one of
+#       shell:<cmd>           shell_output[cmd] (or shell_output[(serial, cmd)]), then closes
+#       tcpip:<port>          tcpip_reply, then closes
+#       exec:sh               a line based shell: each "<cmd> 2>/dev/null; echo <marker>" gets
+#                             shell_output[cmd] back followed by the marker. slow_commands (cmd or
+#                             (serial, cmd)) get no answer
+#
+# Everything it was asked is kept in `requests`.
+
+
+class FakeAdbServer:
+    def __init__(self, port=0):
+        self.devices = {}
+        self.shell_output = {}
+        self.slow_commands = set()
+        self.connect_replies = []
+        self.connect_state = "device"
+        self.tcpip_reply = "restarting in TCP mode port: 5555\n"
+        self.requests = []
+        self.lock = threading.Lock()
+        self.trackers = []
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", port)) # pass the port of a stopped one to "restart" that server
+        self.port = self.sock.getsockname()[1]
+        self.running = False
+
+    def client(self, timeout=2.0):
+        from adb_client import AdbClient
+
+        return AdbClient(port=self.port, timeout=timeout)
+
+    def start(self):
+        self.running = True
+        self.sock.listen(16)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        _close(self.sock) # shutdown first, or the accept thread keeps the port listening
+        with self.lock:
+            trackers, self.trackers = self.trackers, []
+        for conn in trackers:
+            _close(conn)
+
+    def set_devices(self, devices):
+        with self.lock:
+            self.devices = dict(devices)
+            trackers = list(self.trackers)
+        for conn in trackers:
+            try:
+                self._send_block(conn, self._device_list())
+            except OSError:
+                pass
+
+    def drop_trackers(self):
+        # like the server going away: every host:track-devices connection gets closed
+        with self.lock:
+            trackers, self.trackers = self.trackers, []
+        for conn in trackers:
+            _close(conn)
+
+    def _device_list(self):
+        return "".join(f"{serial}\t{state}\n" for serial, state in self.devices.items())
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            service = self._read_request(conn)
+            with self.lock:
+                self.requests.append(service)
+            if service == "host:version":
+                self._okay(conn, "0029")
+            elif service == "host:devices":
+                with self.lock:
+                    listing = self._device_list()
+                self._okay(conn, listing)
+            elif service == "host:track-devices":
+                with self.lock:
+                    conn.sendall(b"OKAY")
+                    self._send_block(conn, self._device_list())
+                    self.trackers.append(conn)
+                return # stays open, set_devices() writes to it
+            elif service.startswith("host:connect:"):
+                self._connect(conn, service[len("host:connect:"):])
+            elif service.startswith("host:transport:"):
+                self._transport(conn, service[len("host:transport:"):])
+            else:
+                self._fail(conn, f"unknown host service '{service}'")
+        except OSError:
+            pass
+        _close(conn)
+
+    def _connect(self, conn, address):
+        with self.lock:
+            reply = self.connect_replies.pop(0) if self.connect_replies else f"connected to {address}"
+            if reply.startswith(("connected to", "already connected")):
+                self.devices[address] = self.connect_state
+        self._okay(conn, reply)
+
+    def _transport(self, conn, serial):
+        with self.lock:
+            known = self.devices.get(serial) == "device"
+        if not known:
+            self._fail(conn, f"device '{serial}' not found")
+            return
+        conn.sendall(b"OKAY")
+        service = self._read_request(conn)
+        with self.lock:
+            self.requests.append(f"{serial}:{service}")
+        if service.startswith("shell:"):
+            conn.sendall(b"OKAY" + self._output(serial, service[len("shell:"):]).encode())
+        elif service.startswith("tcpip:"):
+            conn.sendall(b"OKAY" + self.tcpip_reply.encode())
+        elif service == "exec:sh":
+            conn.sendall(b"OKAY")
+            self._shell(conn, serial)
+        else:
+            self._fail(conn, f"unknown device service '{service}'")
+
+    def _shell(self, conn, serial):
+        buffer = b""
+        while True:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                command, _, marker = line.decode().partition(" 2>/dev/null; echo ")
+                if command in self.slow_commands or (serial, command) in self.slow_commands:
+                    continue
+                output = self._output(serial, command)
+                conn.sendall(f"{output}\n{marker}\n".encode() if output else f"{marker}\n".encode())
+
+    def _output(self, serial, command):
+        with self.lock:
+            output = self.shell_output.get((serial, command), self.shell_output.get(command, ""))
+        return output
+
+    def _read_request(self, conn):
+        size = int(_read_exact(conn, 4), 16)
+        return _read_exact(conn, size).decode()
+
+    def _okay(self, conn, text):
+        conn.sendall(b"OKAY")
+        self._send_block(conn, text)
+
+    def _fail(self, conn, text):
+        conn.sendall(b"FAIL")
+        self._send_block(conn, text)
+
+    def _send_block(self, conn, text):
+        data = text.encode()
+        conn.sendall(b"%04x" % len(data) + data)
+
+
+def _read_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("client went away")
+        data += chunk
+    return data
+
+
+def _close(conn):
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    conn.close()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+
+# Stands in for scrcpy in the SessionManager tests. What it does depends on the serial it's given
+# with -s (a prefix, so several devices can behave the same):
+#
+#   run-...     prints a couple of lines and keeps running until it's terminated
+#   clean-...   exits with 0, like the user closing the window
+#   crash-...   exits with 2 straight away, every time
+#   flaky-...   exits with 2 the first FAKE_SCRCPY_CRASHES times, then keeps running
+#
+# Every start is appended to $FAKE_SCRCPY_LOG as "serial arg arg ...".
+
+args = sys.argv[1:]
+serial = args[args.index("-s") + 1] if "-s" in args else ""
+log = os.environ.get("FAKE_SCRCPY_LOG")
+starts = 0
+if log:
+    if os.path.exists(log):
+        with open(log) as f:
+            starts = sum(1 for line in f if line.split(" ", 1)[0] == serial)
+    with open(log, "a") as f:
+        f.write(" ".join([serial] + args) + "\n")
+
+print(f"INFO: scrcpy (fake) for {serial}", flush=True)
+print("INFO: Renderer: opengl", file=sys.stderr, flush=True)
+
+if serial.startswith("clean"):
+    sys.exit(0)
+if serial.startswith("crash"):
+    sys.exit(2)
+if serial.startswith("flaky") and starts < int(os.environ.get("FAKE_SCRCPY_CRASHES", "2")):
+    sys.exit(2)
+while True:
+    time.sleep(1)
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from conftest import wait_for
+from fake_adb import FakeAdbServer
+
+pytest.importorskip("PyQt6.QtCore")
+
+from device_tracker import DeviceTracker # noqa: E402
+
+
+def record(tracker):
+    events = []
+    lock = threading.Lock()
+
+    def add(*event):
+        with lock:
+            events.append(event)
+
+    tracker.deviceAdded.connect(lambda serial, state: add("added", serial, state))
+    tracker.deviceRemoved.connect(lambda serial: add("removed", serial))
+    tracker.deviceStateChanged.connect(lambda serial, state: add("state", serial, state))
+    tracker.trackerError.connect(lambda message: add("error", message))
+    return events
+
+
+def test_update_diffs_against_last_list(qapp):
+    tracker = DeviceTracker(client=object())
+    events = record(tracker)
+
+    tracker._update({"A": "device", "B": "unauthorized"})
+    assert events == [("added", "A", "device"), ("added", "B", "unauthorized")]
+
+    events.clear()
+    tracker._update({"A": "device", "B": "device", "C": "offline"})
+    assert events == [("state", "B", "device"), ("added", "C", "offline")]
+
+    events.clear()
+    tracker._update({"C": "offline"})
+    assert events == [("removed", "A"), ("removed", "B")]
+
+    events.clear()
+    tracker._update({"C": "offline"})
+    assert events == []
+
+
+def test_follows_the_server(qapp, adb_server):
+    adb_server.set_devices({"A": "device"})
+    tracker = DeviceTracker(client=adb_server.client(), retry_interval=0.05)
+    events = record(tracker)
+    tracker.start()
+    try:
+        assert wait_for(lambda: ("added", "A", "device") in events, app=qapp)
+
+        adb_server.set_devices({"A": "device", "10.0.0.5:5555": "offline"})
+        assert wait_for(lambda: ("added", "10.0.0.5:5555", "offline") in events, app=qapp)
+        adb_server.set_devices({"10.0.0.5:5555": "device"})
+        assert wait_for(lambda: ("state", "10.0.0.5:5555", "device") in events, app=qapp)
+        assert ("removed", "A") in events
+        assert adb_server.requests.count("host:track-devices") == 1 # one connection, no polling
+    finally:
+        started = time.monotonic()
+        tracker.stop()
+    assert time.monotonic() - started < 1 # stop() doesn't sit out the join timeout
+
+
+def test_reconnects_when_the_connection_drops(qapp, adb_server):
+    adb_server.set_devices({"A": "device"})
+    tracker = DeviceTracker(client=adb_server.client(), retry_interval=0.05)
+    events = record(tracker)
+    tracker.start()
+    try:
+        assert wait_for(lambda: ("added", "A", "device") in events, app=qapp)
+        adb_server.drop_trackers()
+        assert wait_for(lambda: any(e[0] == "error" for e in events), app=qapp)
+        assert wait_for(lambda: adb_server.requests.count("host:track-devices") == 2, app=qapp)
+
+        adb_server.set_devices({"A": "device", "B": "device"})
+        assert wait_for(lambda: ("added", "B", "device") in events, app=qapp)
+        assert events.count(("added", "A", "device")) == 1 # same list after the reconnect, nothing new
+    finally:
+        tracker.stop()
+
+
+def test_reports_an_outage_once_and_backs_off(qapp, adb_server, monkeypatch):
+    adb_server.set_devices({"A": "device"})
+    client = adb_server.client()
+    connects = []
+    connect = client.connect
+    monkeypatch.setattr(client, "connect", lambda *args: connects.append(1) or connect(*args))
+    tracker = DeviceTracker(client=client, retry_interval=0.02, max_retry_interval=0.1)
+    starts = []
+    monkeypatch.setattr(tracker, "_start_server", lambda: starts.append(1))
+    events = record(tracker)
+    errors = lambda: [e for e in events if e[0] == "error"] # noqa: E731
+    tracker.start()
+    restarted = None
+    try:
+        assert wait_for(lambda: ("added", "A", "device") in events, app=qapp)
+        adb_server.stop()
+        assert wait_for(lambda: len(errors()) == 1, app=qapp)
+        connects.clear()
+        wait_for(lambda: False, timeout=0.6, app=qapp)
+        assert len(errors()) == 1 # not one per retry
+        assert len(starts) == 1   # start-server tried once this outage
+        assert len(connects) < 12 # ~30 at a flat 20 ms
+
+        restarted = FakeAdbServer(adb_server.port)
+        restarted.start()
+        restarted.set_devices({"A": "device", "B": "device"})
+        assert wait_for(lambda: ("added", "B", "device") in events, app=qapp)
+        assert wait_for(lambda: "back" in errors()[-1][1], app=qapp)
+
+        # a new outage is reported again, and gets its own start-server attempt
+        restarted.stop()
+        assert wait_for(lambda: len(errors()) == 3 and len(starts) == 2, app=qapp)
+    finally:
+        tracker.stop()
+        if restarted is not None:
+            restarted.stop()
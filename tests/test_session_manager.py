@@ -0,0 +1,199 @@
+import os
+import threading
+
+import pytest
+
+from conftest import wait_for
+
+pytest.importorskip("PyQt6.QtCore")
+
+from session_manager import RestartPolicy, SessionManager, parse_bitrate, parse_fps # noqa: E402
+
+FAKE_SCRCPY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_scrcpy.py")
+BATTERY = "Current Battery Service state:\n  AC powered: false\n  USB powered: true\n  status: 2\n  level: {level}\n  temperature: 312\n"
+
+
+@pytest.fixture
+def scrcpy_log(tmp_path, monkeypatch):
+    path = tmp_path / "scrcpy.log"
+    monkeypatch.setenv("FAKE_SCRCPY_LOG", str(path))
+    monkeypatch.setenv("FAKE_SCRCPY_CRASHES", "2")
+    return path
+
+
+def starts(log, serial):
+    if not log.exists():
+        return 0
+    return sum(1 for line in log.read_text().splitlines() if line.split(" ", 1)[0] == serial)
+
+
+@pytest.fixture
+def manager(qapp, adb_server):
+    manager = SessionManager(client=adb_server.client(), scrcpy=FAKE_SCRCPY, tick_interval=20,
+                             telemetry_interval=0.1, restart_backoff=0.05, max_restarts=3, telemetry_timeout=0.5)
+    manager.events = {"state": [], "message": [], "telemetry": {}, "output": []}
+    lock = threading.Lock()
+
+    def add(kind, item):
+        with lock:
+            manager.events[kind].append(item)
+
+    def telemetry(serial, values):
+        with lock:
+            manager.events["telemetry"].setdefault(serial, []).append(values)
+
+    manager.sessionState.connect(lambda serial, state: add("state", (serial, state)))
+    manager.sessionMessage.connect(lambda serial, message: add("message", (serial, message)))
+    manager.sessionOutput.connect(lambda serial, line, err: add("output", (serial, line, err)))
+    manager.telemetryUpdated.connect(telemetry)
+    yield manager
+    manager.shutdown()
+
+
+def test_parsers():
+    assert parse_bitrate("8M") == 8000000
+    assert parse_bitrate("2000K") == 2000000
+    assert parse_bitrate("500000") == 500000
+    assert parse_bitrate("fast") is None
+    assert parse_fps("30") == 30
+    assert parse_fps(" 60 ") == 60
+    assert parse_fps("30.5") is None
+    assert parse_fps("60fps") is None
+    assert parse_fps("0") is None
+
+
+def test_restart_policy_backs_off_then_gives_up():
+    policy = RestartPolicy(max_restarts=3, window=60, backoff=1, max_backoff=3)
+    assert [policy.next_delay(t) for t in (0, 1, 2)] == [1, 2, 3]
+    assert policy.next_delay(3) is None
+    assert policy.next_delay(100) == 1 # old crashes fell out of the window
+
+
+def test_telemetry_fans_out_to_eight_devices(manager, adb_server, qapp):
+    serials = [f"dev{i}" for i in range(8)]
+    adb_server.set_devices({serial: "device" for serial in serials})
+    for i, serial in enumerate(serials):
+        adb_server.shell_output[(serial, "dumpsys battery")] = BATTERY.format(level=50 + i)
+    adb_server.shell_output["dumpsys thermalservice"] = "Thermal Status: 1"
+    for serial in serials:
+        manager.add(serial)
+
+    telemetry = manager.events["telemetry"]
+    assert wait_for(lambda: all(len(telemetry.get(serial, [])) >= 2 for serial in serials), app=qapp)
+    for i, serial in enumerate(serials):
+        assert telemetry[serial][-1] == {"level": 50 + i, "temperature": 31.2, "status": "charging",
+                                         "plugged": True, "thermal": "light"}
+    # one exec:sh per device, reused for every poll
+    assert sum(1 for r in adb_server.requests if r.endswith(":exec:sh")) == 8
+
+
+def test_slow_device_doesnt_hold_up_the_others(manager, adb_server, qapp):
+    serials = [f"dev{i}" for i in range(6)]
+    adb_server.set_devices({serial: "device" for serial in serials})
+    adb_server.shell_output["dumpsys battery"] = BATTERY.format(level=80)
+    adb_server.slow_commands.add(("dev0", "dumpsys battery"))
+    for serial in serials:
+        manager.add(serial)
+
+    telemetry = manager.events["telemetry"]
+    assert wait_for(lambda: all(len(telemetry.get(serial, [])) >= 3 for serial in serials[1:]), app=qapp)
+    assert wait_for(lambda: ("dev0", "dev0: no answer in time") in manager.events["message"], app=qapp)
+    assert "dev0" not in telemetry
+
+
+def test_streams_restart_give_up_and_stay_closed(manager, adb_server, qapp, scrcpy_log):
+    serials = ["run-a", "run-b", "flaky-a", "crash-a", "clean-a", "run-c"]
+    for serial in serials:
+        assert manager.start_stream(serial)
+    states = manager.events["state"]
+
+    # crash-a: first start + max_restarts restarts, then failed
+    assert wait_for(lambda: ("crash-a", "failed") in states, app=qapp)
+    assert starts(scrcpy_log, "crash-a") == 4
+    assert ("crash-a", "backoff") in states
+    assert any(s == "crash-a" and "keeps exiting" in m for s, m in manager.events["message"])
+
+    # flaky-a crashes twice, then stays up
+    assert wait_for(lambda: starts(scrcpy_log, "flaky-a") == 3, app=qapp)
+    assert wait_for(lambda: manager.sessions["flaky-a"].process is not None, app=qapp)
+
+    # clean-a exited 0: stopped, not restarted
+    assert wait_for(lambda: ("clean-a", "idle") in states, app=qapp)
+    wait_for(lambda: False, timeout=0.3, app=qapp)
+    assert starts(scrcpy_log, "clean-a") == 1
+    assert ("clean-a", "backoff") not in states
+
+    assert sorted(manager.streaming()) == ["flaky-a", "run-a", "run-b", "run-c"]
+    assert all(starts(scrcpy_log, serial) == 1 for serial in ("run-a", "run-b", "run-c"))
+    assert wait_for(lambda: ("run-a", "INFO: scrcpy (fake) for run-a", False) in manager.events["output"], app=qapp)
+    assert ("run-a", "INFO: Renderer: opengl", True) in manager.events["output"]
+
+    manager.stop_stream("run-b")
+    assert ("run-b", "idle") in states
+    wait_for(lambda: False, timeout=0.3, app=qapp)
+    assert starts(scrcpy_log, "run-b") == 1 # a stop isn't a crash
+    assert sorted(manager.streaming()) == ["flaky-a", "run-a", "run-c"]
+
+
+def test_options_are_checked(manager, qapp, scrcpy_log):
+    assert not manager.start_stream("run-a", max_fps="30.5")
+    assert not manager.start_stream("run-a", max_fps="60fps")
+    assert not manager.start_stream("run-a", bitrate="fast")
+    assert manager.streaming() == []
+    assert any("max fps '30.5' isn't valid" in m for _, m in manager.events["message"])
+
+    assert manager.start_stream("run-a", bitrate="16M", max_fps="30")
+    assert any("capped to 8000K" in m for _, m in manager.events["message"])
+    args = manager.sessions["run-a"].arguments()
+    assert args[args.index("-b") + 1] == "8000000"
+    assert args[args.index("--max-fps") + 1] == "30"
+
+
+def test_missing_scrcpy_fails_once(qapp, adb_server):
+    manager = SessionManager(client=adb_server.client(), scrcpy="/nonexistent/scrcpy", tick_interval=20)
+    states = []
+    manager.sessionState.connect(lambda serial, state: states.append(state))
+    try:
+        manager.start_stream("run-a")
+        assert wait_for(lambda: "failed" in states, app=qapp)
+        assert manager.streaming() == []
+    finally:
+        manager.shutdown()
+
+
+def test_failing_telemetry_is_reported_once_and_backs_off(manager, adb_server, qapp):
+    manager.max_telemetry_interval = 0.4
+    manager.add("gone")
+    messages = manager.events["message"]
+    polls = lambda: sum(1 for r in adb_server.requests if r == "host:transport:gone") # noqa: E731
+
+    assert wait_for(lambda: messages, app=qapp)
+    wait_for(lambda: False, timeout=1.0, app=qapp)
+    assert len(messages) == 1 and "telemetry session lost" in messages[0][1]
+    assert 2 <= polls() <= 5 # every 0.1 s would be ~10
+
+    adb_server.set_devices({"gone": "device"})
+    adb_server.shell_output["dumpsys battery"] = BATTERY.format(level=70)
+    assert wait_for(lambda: "gone" in manager.events["telemetry"], app=qapp)
+    assert messages[-1] == ("gone", "telemetry is back")
+    assert manager.sessions["gone"].telemetry_failures == 0
+
+
+def test_unexpected_poll_error_doesnt_stop_telemetry(manager, adb_server, qapp):
+    manager.max_telemetry_interval = 0.2
+    adb_server.set_devices({"odd": "device"})
+    adb_server.shell_output["dumpsys battery"] = BATTERY.format(level=60)
+    session = manager.add("odd")
+    poll_once = session.telemetry.poll_once
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) <= 2:
+            raise ValueError("unexpected dumpsys output")
+        return poll_once()
+
+    session.telemetry.poll_once = flaky
+    assert wait_for(lambda: "odd" in manager.events["telemetry"], app=qapp)
+    failures = [m for _, m in manager.events["message"] if "poll failed" in m]
+    assert failures == ["telemetry poll failed: ValueError('unexpected dumpsys output')"]
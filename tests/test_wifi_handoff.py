@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+pytest.importorskip("PyQt6.QtCore")
+
+from wifi_handoff import WifiHandoff, parse_route_ip # noqa: E402
+
+SERIAL = "R58M123"
+ROUTE = "1.0.0.0 via 192.168.1.1 dev wlan0 table 1021 src 192.168.1.23 uid 2000"
+ADDRESS = "192.168.1.23:5555"
+
+
+@pytest.fixture
+def phone(adb_server):
+    adb_server.set_devices({SERIAL: "device"})
+    adb_server.shell_output["ip route get 1"] = ROUTE
+    return adb_server
+
+
+def run(server, **kwargs):
+    handoff = WifiHandoff(SERIAL, client=server.client(), poll_interval=0.01, **kwargs)
+    result = {"states": [], "finished": None, "failed": None}
+    handoff.progress.connect(lambda state, message: result["states"].append(state))
+    handoff.finished.connect(lambda address: result.__setitem__("finished", address))
+    handoff.failed.connect(lambda message: result.__setitem__("failed", message))
+    handoff.run()
+    return handoff, result
+
+
+def test_parse_route_ip():
+    assert parse_route_ip(ROUTE) == "192.168.1.23"
+    assert parse_route_ip("1.0.0.0 via 10.0.0.1 dev wlan0 src 10.0.0.7\n") == "10.0.0.7"
+    assert parse_route_ip("RTNETLINK answers: Network is unreachable") is None
+    assert parse_route_ip("1.0.0.0 dev rmnet0 src") is None
+    assert parse_route_ip("") is None
+
+
+def test_goes_through_every_state(phone):
+    handoff, result = run(phone)
+    assert result["failed"] is None
+    assert result["finished"] == ADDRESS
+    assert result["states"] == ["find_ip", "tcpip", "connect", "wait_online"]
+    assert handoff.state == "done"
+    assert f"{SERIAL}:tcpip:5555" in phone.requests
+    assert f"host:connect:{ADDRESS}" in phone.requests
+
+
+def test_no_src_in_route_fails_cleanly(phone):
+    phone.shell_output["ip route get 1"] = "RTNETLINK answers: Network is unreachable"
+    handoff, result = run(phone)
+    assert result["finished"] is None
+    assert "is Wi-Fi on?" in result["failed"]
+    assert handoff.state == "failed"
+    assert not any(r.endswith("tcpip:5555") for r in phone.requests)
+
+
+def test_tcpip_refused(phone):
+    phone.tcpip_reply = "error: closed\n"
+    handoff, result = run(phone)
+    assert "error: closed" in result["failed"]
+    assert result["states"] == ["find_ip", "tcpip"]
+
+
+def test_connect_retries_while_adbd_restarts(phone):
+    phone.connect_replies = [f"failed to connect to {ADDRESS}", f"failed to connect to {ADDRESS}"]
+    handoff, result = run(phone)
+    assert result["finished"] == ADDRESS
+    assert phone.requests.count(f"host:connect:{ADDRESS}") == 3
+
+
+def test_waits_until_the_transport_is_online(phone):
+    phone.connect_state = "offline"
+    threading.Timer(0.2, lambda: phone.set_devices({SERIAL: "device", ADDRESS: "device"})).start()
+    handoff, result = run(phone)
+    assert result["finished"] == ADDRESS
+    assert phone.requests.count("host:devices") > 1 # polled while offline
+
+
+def test_unauthorized(phone):
+    phone.connect_state = "unauthorized"
+    handoff, result = run(phone)
+    assert "unauthorized" in result["failed"]
+    assert result["states"][-1] == "wait_online"
+
+
+def test_times_out(phone):
+    phone.connect_replies = ["failed to connect"] * 1000
+    handoff, result = run(phone, timeout=0.3)
+    assert "timed out while in connect" in result["failed"]
+
+
+def test_device_gone(adb_server):
+    handoff, result = run(adb_server) # serial not known to the server
+    assert "not found" in result["failed"]
+
+
+def test_cancel(phone):
+    phone.connect_replies = ["failed to connect"] * 1000
+    handoff = WifiHandoff(SERIAL, client=phone.client(), poll_interval=0.01)
+    failed = []
+    handoff.failed.connect(failed.append)
+    threading.Timer(0.1, handoff.cancel).start()
+    handoff.run()
+    assert failed == ["Wi-Fi switch failed: cancelled"]